@@ -0,0 +1,108 @@
+# asgi.py
+#
+# Asyncio serving mode: /stream-chat and the chatStream GraphQL subscription
+# (websocket /graphql) run on the event loop with ollama.AsyncClient (via
+# llm_client), so an idle stream costs a coroutine instead of a Waitress
+# thread. Style job events are streamed from here for the same reason. Every
+# other route is the regular Flask app mounted through WSGIMiddleware.
+
+import asyncio
+import json
+
+from ariadne.asgi import GraphQL
+from ariadne.asgi.handlers import GraphQLTransportWSHandler
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route, WebSocketRoute
+
+from app.main import my_app
+from app.auth import bearer_token
+from app.chat_service import INVALID_USER_MESSAGE, chat_service
+from app.llm_client import LLMBusyError
+from app.observability import TRACE_HEADER, TRACE_IDS, new_trace_id, trace_id_var
+from app.schema import schema
+from app.style_jobs import style_jobs
+
+# How often job event streams check for a status change
+JOB_POLL_INTERVAL = 0.5
+
+
+async def stream_chat(request):
+    if TRACE_IDS:
+        # Each request runs in its own task, so this is scoped to it (and its thread hops)
+        trace_id_var.set(new_trace_id(request.headers.get(TRACE_HEADER)))
+    data = await request.json()
+
+    # Authorization: Bearer <login token>, or the legacy username field
+    turn = await chat_service.astart(data["message"], data.get("documentId"), username=data.get("username"),
+                                     token=bearer_token(request) or data.get("token"))
+    if turn is None:
+        async def error_gen():
+            yield f"data: {INVALID_USER_MESSAGE}\n\n"
+        return StreamingResponse(error_gen(), media_type="text/event-stream")
+
+    # Wait for the first token before answering, so "busy" can still be a 503
+    tokens = turn.astream()
+    try:
+        first_token = await tokens.__anext__()
+    except StopAsyncIteration:
+        first_token = None
+    except LLMBusyError as e:
+        message = str(e)  # e is unbound once the except block ends
+        async def busy_gen():
+            yield f"data: Error: {message}\n\n"
+        return StreamingResponse(busy_gen(), status_code=503, media_type="text/event-stream",
+                                 headers={"Retry-After": "5"})
+    except Exception as e:
+        message = str(e)
+        async def failed_gen():
+            yield f"data: Error: {message}\n\n"
+        return StreamingResponse(failed_gen(), media_type="text/event-stream")
+
+    async def generate():
+        try:
+            if first_token is not None:
+                yield f"data: {json.dumps({'token': first_token})}\n\n"
+                # The turn is saved once the last token has been read
+                async for token in tokens:
+                    yield f"data: {json.dumps({'token': token})}\n\n"
+        except Exception as e:
+            yield f"data: Error: {str(e)}\n\n"
+        finally:
+            await tokens.aclose()
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
+async def style_transfer_job_events(request):
+    job_id = request.path_params["job_id"]
+    if style_jobs.status(job_id) is None:
+        return JSONResponse({"success": False, "message": "Unknown job"}, status_code=404)
+
+    async def generate():
+        last = None
+        while True:
+            status = style_jobs.status(job_id)
+            if status is None:
+                return
+            if status != last:
+                yield f"data: {json.dumps(status)}\n\n"
+                last = status
+            if status["status"] in ("done", "failed"):
+                return
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
+# GraphQL subscriptions (chatStream) over graphql-transport-ws; queries and
+# mutations keep going to the Flask /graphql route
+graphql_ws = GraphQL(schema, websocket_handler=GraphQLTransportWSHandler())
+
+app = Starlette(routes=[
+    Route("/stream-chat", stream_chat, methods=["POST"]),
+    Route("/style-transfer-jobs/{job_id}/events", style_transfer_job_events, methods=["GET"]),
+    WebSocketRoute("/graphql", graphql_ws),
+    Mount("/", app=WSGIMiddleware(my_app)),
+])
@@ -0,0 +1,97 @@
+# auth.py
+#
+# Stateless login tokens: login signs the user id with itsdangerous, and
+# every later call gets the id back from the signature alone, without a
+# user lookup or password check. Logout adds the token's id to an in-memory
+# revocation list that forgets entries once they would have expired anyway.
+
+import logging
+import os
+import threading
+import time
+import uuid
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+logger = logging.getLogger(__name__)
+
+TOKEN_MAX_AGE = int(os.environ.get("TOKEN_MAX_AGE", 7 * 24 * 3600))
+
+SECRET_KEY = os.environ.get("SECRET_KEY")
+if not SECRET_KEY:
+    # Tokens then only survive until the next restart (and only on this process)
+    logger.warning("SECRET_KEY is not set; using a random key for login tokens")
+    SECRET_KEY = os.urandom(32).hex()
+
+
+class TokenRevocationList:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._revoked = {}  # token id -> time after which the token is dead anyway
+        self._lock = threading.Lock()
+
+    def revoke(self, token_id, expires_at):
+        with self._lock:
+            self._revoked[token_id] = expires_at
+            self._purge()
+
+    def is_revoked(self, token_id):
+        with self._lock:
+            return token_id in self._revoked
+
+    def _purge(self):
+        now = self.clock()
+        for token_id in [t for t, expires_at in self._revoked.items() if expires_at <= now]:
+            del self._revoked[token_id]
+
+
+class TokenAuth:
+    def __init__(self, secret_key=SECRET_KEY, max_age=TOKEN_MAX_AGE):
+        self.max_age = max_age
+        self.serializer = URLSafeTimedSerializer(secret_key, salt="login-token")
+        self.revoked = TokenRevocationList()
+
+    def issue(self, user_id):
+        return self.serializer.dumps({"uid": user_id, "jti": uuid.uuid4().hex})
+
+    def _load(self, token):
+        try:
+            payload, issued_at = self.serializer.loads(token, max_age=self.max_age, return_timestamp=True)
+        except (BadSignature, SignatureExpired):
+            return None, None
+        if not isinstance(payload, dict) or self.revoked.is_revoked(payload.get("jti")):
+            return None, None
+        return payload, issued_at
+
+    def user_id(self, token):
+        """User id carried by a valid, unrevoked token, else None."""
+        if not token:
+            return None
+        payload, _ = self._load(token)
+        return payload["uid"] if payload else None
+
+    def revoke(self, token):
+        """Revoke ``token``; False if it wasn't a valid token to begin with."""
+        payload, issued_at = self._load(token) if token else (None, None)
+        if payload is None:
+            return False
+        self.revoked.revoke(payload["jti"], issued_at.timestamp() + self.max_age)
+        return True
+
+
+token_auth = TokenAuth()
+
+
+def bearer_token(request):
+    """Token from an ``Authorization: Bearer ...`` header, if any."""
+    header = request.headers.get("Authorization", "") if request is not None else ""
+    scheme, _, token = header.partition(" ")
+    if scheme.lower() == "bearer" and token.strip():
+        return token.strip()
+    return None
+
+
+def context_token(context):
+    # GraphQL context is the Flask request, or {"request": ...} for subscriptions
+    request = context.get("request") if isinstance(context, dict) else context
+    return bearer_token(request)
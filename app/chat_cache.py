@@ -0,0 +1,260 @@
+# chat_cache.py
+#
+# Opt-in response cache + single-flight coalescing for chat generations.
+# Identical requests (same normalized messages, model and options) share one
+# in-flight Ollama generation; every caller, streaming or not, sync or on
+# the ASGI event loop, receives the same tokens, and finished replies are
+# kept for a short TTL.
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app import llm_client
+from app.metrics import Counter
+
+CHAT_CACHE_ENABLED = os.environ.get("CHAT_CACHE_ENABLED", "0") == "1"
+CHAT_CACHE_TTL = float(os.environ.get("CHAT_CACHE_TTL", 300))
+CHAT_CACHE_SIZE = int(os.environ.get("CHAT_CACHE_SIZE", 1024))
+
+chat_cache_events = Counter(
+    "chat_cache_events_total", "Chat response cache lookups by result", ["result"])
+
+
+def cache_key(messages, model, options):
+    normalized = [
+        {"role": m["role"].strip().lower(), "content": " ".join(m["content"].split())}
+        for m in messages
+    ]
+    payload = json.dumps(
+        {"model": model, "messages": normalized, "options": options or {}},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SharedGeneration:
+    """Tokens of one generation, readable by any number of subscribers.
+
+    A producer thread appends tokens as they arrive; each subscriber replays
+    what it missed and then waits for more, so late joiners see the whole
+    reply. Async subscribers wait on an asyncio.Event that the producer sets
+    through their loop, so they don't hold a thread while waiting.
+    """
+
+    def __init__(self):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+        self._async_waiters = []  # (loop, asyncio.Event)
+
+    def _notify(self):
+        # Called with _cond held
+        self._cond.notify_all()
+        for loop, event in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # that subscriber's loop has closed
+        self._async_waiters.clear()
+
+    def append(self, token):
+        with self._cond:
+            self.tokens.append(token)
+            self._notify()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._notify()
+
+    def _read(self, index):
+        # Called with _cond held: (new tokens, finished, error)
+        pending = self.tokens[index:]
+        return pending, self.done and index + len(pending) >= len(self.tokens), self.error
+
+    def subscribe(self):
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.tokens) and not self.done:
+                    self._cond.wait()
+                pending, finished, error = self._read(index)
+            index += len(pending)
+            for token in pending:
+                yield token
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+    async def asubscribe(self):
+        loop = asyncio.get_running_loop()
+        index = 0
+        while True:
+            with self._cond:
+                if index >= len(self.tokens) and not self.done:
+                    event = asyncio.Event()
+                    self._async_waiters.append((loop, event))
+                else:
+                    event = None
+                    pending, finished, error = self._read(index)
+            if event is not None:
+                await event.wait()
+                continue
+            index += len(pending)
+            for token in pending:
+                yield token
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+
+class _Subscription:
+    """Token iterator with the same ``close()`` contract as llm_client.ChatStream."""
+
+    def __init__(self, tokens):
+        self._tokens = tokens
+
+    def __iter__(self):
+        return iter(self._tokens)
+
+    def close(self):
+        if hasattr(self._tokens, "close"):
+            self._tokens.close()
+
+
+class ChatResponseCache:
+    def __init__(self, open_stream, ttl=CHAT_CACHE_TTL, max_size=CHAT_CACHE_SIZE):
+        self.open_stream = open_stream
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self._replies = OrderedDict()  # key -> (expires_at, reply)
+        self._inflight = {}            # key -> SharedGeneration
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        entry = self._replies.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._replies[key]
+            return None
+        self._replies.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key, reply):
+        self._replies[key] = (time.monotonic() + self.ttl, reply)
+        self._replies.move_to_end(key)
+        while len(self._replies) > self.max_size:
+            self._replies.popitem(last=False)
+
+    def _join(self, messages, model, options):
+        """(cached reply, None), or (None, the SharedGeneration to follow).
+
+        Raises whatever ``open_stream`` raises (e.g. LLMBusyError) when this
+        call has to start a new generation.
+        """
+        key = cache_key(messages, model, options)
+        with self._lock:
+            reply = self._lookup(key)
+            if reply is not None:
+                chat_cache_events.inc(result="hit")
+                return reply, None
+            shared = self._inflight.get(key)
+            if shared is not None:
+                chat_cache_events.inc(result="coalesced")
+                return None, shared
+            chat_cache_events.inc(result="miss")
+            shared = self._inflight[key] = SharedGeneration()
+
+        try:
+            stream = self.open_stream(messages, model=model, options=options)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            shared.finish(e)
+            raise
+
+        # Drive the generation off the request thread so it completes (and
+        # is cached) even if the client that started it disconnects
+        threading.Thread(
+            target=self._produce, args=(key, stream, shared), name="chat-cache-producer", daemon=True
+        ).start()
+        return None, shared
+
+    def open(self, messages, model, options=None):
+        """Return an iterable of reply tokens, sharing work with identical requests."""
+        reply, shared = self._join(messages, model, options)
+        if shared is None:
+            return _Subscription(iter([reply]))
+        return _Subscription(shared.subscribe())
+
+    async def aopen(self, messages, model, options=None):
+        """Async token generator, coalesced with sync and async callers alike.
+
+        Joining (which may wait for an Ollama slot) runs in a worker thread;
+        waiting for tokens doesn't hold one.
+        """
+        import anyio
+
+        reply, shared = await anyio.to_thread.run_sync(self._join, messages, model, options)
+        if shared is None:
+            yield reply
+            return
+        async for token in shared.asubscribe():
+            yield token
+
+    def _produce(self, key, stream, shared):
+        error = None
+        try:
+            for token in stream:
+                shared.append(token)
+        except Exception as e:
+            error = e
+        finally:
+            stream.close()
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is None:
+                self._store(key, "".join(shared.tokens))
+        shared.finish(error)
+
+    def clear(self):
+        with self._lock:
+            self._replies.clear()
+
+
+chat_cache = ChatResponseCache(llm_client.open_chat_stream)
+
+
+def open_chat_stream(messages, model=llm_client.MODEL_NAME, options=None):
+    """Token stream for ``messages``, going through the cache when it's enabled."""
+    options = options or llm_client.DEFAULT_OPTIONS
+    if CHAT_CACHE_ENABLED:
+        return chat_cache.open(messages, model, options)
+    return llm_client.open_chat_stream(messages, model=model, options=options)
+
+
+def astream_chat(messages, model=llm_client.MODEL_NAME, options=None):
+    """Async counterpart of open_chat_stream for the ASGI paths."""
+    options = options or llm_client.DEFAULT_OPTIONS
+    if CHAT_CACHE_ENABLED:
+        return chat_cache.aopen(messages, model, options)
+    return llm_client.astream_chat(messages, model=model, options=options)
+
+
+def chat(messages, model=llm_client.MODEL_NAME, options=None):
+    stream = open_chat_stream(messages, model=model, options=options)
+    try:
+        return "".join(stream)
+    finally:
+        stream.close()
@@ -0,0 +1,396 @@
+# chat_history.py
+#
+# Read/write paths for ChatHistory. The hot "last N turns" lookup selects
+# plain columns so no ORM entities (identity map, state tracking) are built,
+# and ConversationCache lets most turns skip the database entirely.
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from sqlalchemy import insert, literal, select, union_all
+
+from app.metrics import Counter, Histogram
+from app.models import db, User, ChatHistory
+
+MAX_PAGE_SIZE = 100
+
+CONVERSATION_CACHE_USERS = int(os.environ.get("CONVERSATION_CACHE_USERS", 10000))
+CONVERSATION_CACHE_TURNS = int(os.environ.get("CONVERSATION_CACHE_TURNS", 20))
+
+# Background batched writes of chat turns (0 = commit inside the request)
+CHAT_WRITE_BATCHING = os.environ.get("CHAT_WRITE_BATCHING", "1") == "1"
+CHAT_FLUSH_SIZE = int(os.environ.get("CHAT_FLUSH_SIZE", 200))
+CHAT_FLUSH_INTERVAL = float(os.environ.get("CHAT_FLUSH_INTERVAL_MS", 50)) / 1000.0
+# Failed attempts at writing a batch before it is logged and dropped
+CHAT_FLUSH_MAX_RETRIES = int(os.environ.get("CHAT_FLUSH_MAX_RETRIES", 5))
+
+logger = logging.getLogger(__name__)
+
+chat_flush_seconds = Histogram(
+    "chat_history_flush_seconds", "Time to insert and commit one batch of chat turns")
+chat_rows_written = Counter(
+    "chat_history_rows_written_total", "Chat history rows committed by the background writer")
+chat_rows_dropped = Counter(
+    "chat_history_rows_dropped_total", "Chat history rows given up on after repeated write failures")
+
+
+def recent_turns(user_id, limit=2):
+    """Last ``limit`` turns for a user as role/content dicts, oldest first.
+
+    Includes turns still queued in the background writer.
+    """
+    query = (
+        select(ChatHistory.role, ChatHistory.content)
+        .where(ChatHistory.user_id == user_id)
+        .order_by(ChatHistory.id.desc())
+        .limit(limit)
+    )
+    for _ in range(3):
+        generation, pending = chat_writer.pending_for(user_id)
+        rows = db.session.execute(query).all()
+        # A flush committing between the two reads would duplicate or drop turns; retry
+        if generation % 2 == 0 and chat_writer.generation == generation:
+            break
+    else:
+        # Busy writer: read with flushes held off so the two reads line up
+        with chat_writer.paused(user_id) as pending:
+            rows = db.session.execute(query).all()
+    turns = [{"role": role, "content": content} for role, content in reversed(rows)] + pending
+    return turns[-limit:] if limit else []
+
+
+def _page_query(user_id, first, after, *extra_columns):
+    query = (
+        select(ChatHistory.id, ChatHistory.role, ChatHistory.content, *extra_columns)
+        .where(ChatHistory.user_id == user_id)
+        .order_by(ChatHistory.id.asc())
+    )
+    if after is not None:
+        query = query.where(ChatHistory.id > after)
+    if first is not None:
+        query = query.limit(max(0, min(first, MAX_PAGE_SIZE)))
+    return query
+
+
+def history_page(user_id, first=None, after=None):
+    """Turns in id order, starting after the ``after`` cursor (a message id)."""
+    # Queued turns have no id yet; give the writer a moment so the page is complete
+    chat_writer.wait_flushed(user_id)
+    rows = db.session.execute(_page_query(user_id, first, after)).all()
+    return [{"id": id_, "role": role, "content": content} for id_, role, content in rows]
+
+
+def history_pages(requests):
+    """Several history pages in one round trip.
+
+    ``requests`` is a list of (user_id, first, after); returns a dict from
+    each request tuple to its page, same as history_page would.
+    """
+    requests = list(dict.fromkeys(requests))
+    if len(requests) < 2:
+        return {r: history_page(*r) for r in requests}
+
+    for user_id in {r[0] for r in requests}:
+        chat_writer.wait_flushed(user_id)
+    # Each page keeps its own ORDER BY/LIMIT inside a subquery, tagged with its index
+    parts = [
+        select(_page_query(user_id, first, after, literal(i).label("request")).subquery())
+        for i, (user_id, first, after) in enumerate(requests)
+    ]
+    pages = {r: [] for r in requests}
+    for id_, role, content, index in db.session.execute(union_all(*parts)).all():
+        pages[requests[index]].append({"id": id_, "role": role, "content": content})
+    for page in pages.values():
+        page.sort(key=lambda turn: turn["id"])
+    return pages
+
+
+class _Conversation:
+    __slots__ = ("turns", "loading", "stale")
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)
+        self.loading = True
+        self.stale = False
+
+
+class ConversationCache:
+    """Write-through cache of each user's most recent turns.
+
+    Keeps a username -> id map and a ring buffer of the last ``max_turns``
+    turns per user, both LRU-bounded, so the chat hot path can build its
+    prompt without touching the database. A user's buffer is filled from
+    the database on first use and appended to whenever a turn is recorded;
+    a write that lands while the buffer is still being loaded marks it
+    stale so it is never cached with a missing turn.
+    """
+
+    def __init__(self, max_users=CONVERSATION_CACHE_USERS, max_turns=CONVERSATION_CACHE_TURNS):
+        self.max_users = max(1, max_users)
+        self.max_turns = max(1, max_turns)
+        self._user_ids = OrderedDict()       # username -> user id
+        self._conversations = OrderedDict()  # user id -> _Conversation
+        self._lock = threading.Lock()
+
+    def user_id(self, username):
+        with self._lock:
+            user_id = self._user_ids.get(username)
+            if user_id is not None:
+                self._user_ids.move_to_end(username)
+                return user_id
+
+        user_id = db.session.execute(
+            select(User.id).where(User.username == username)
+        ).scalar()
+        if user_id is not None:
+            with self._lock:
+                self._user_ids[username] = user_id
+                while len(self._user_ids) > self.max_users:
+                    self._user_ids.popitem(last=False)
+        return user_id
+
+    def recent(self, user_id, limit=2):
+        if limit > self.max_turns:
+            return recent_turns(user_id, limit)
+
+        with self._lock:
+            conversation = self._conversations.get(user_id)
+            if conversation is not None and not conversation.loading:
+                self._conversations.move_to_end(user_id)
+                return list(conversation.turns)[-limit:] if limit else []
+            if conversation is None:
+                conversation = _Conversation(self.max_turns)
+                self._conversations[user_id] = conversation
+                self._evict()
+
+        turns = recent_turns(user_id, self.max_turns)
+
+        with self._lock:
+            if self._conversations.get(user_id) is conversation:
+                if conversation.stale:
+                    # A turn was recorded mid-load; let the next call reload
+                    del self._conversations[user_id]
+                elif conversation.loading:
+                    conversation.turns.extend(turns)
+                    conversation.loading = False
+        return turns[-limit:] if limit else []
+
+    def append(self, user_id, turns):
+        with self._lock:
+            conversation = self._conversations.get(user_id)
+            if conversation is None:
+                return
+            if conversation.loading:
+                conversation.stale = True
+                return
+            conversation.turns.extend(turns)
+            self._conversations.move_to_end(user_id)
+
+    def forget(self, user_id):
+        """Drop everything cached for ``user_id``: its turns and any username mapped to it."""
+        with self._lock:
+            self._conversations.pop(user_id, None)
+            for username in [name for name, uid in self._user_ids.items() if uid == user_id]:
+                del self._user_ids[username]
+
+    def _evict(self):
+        while len(self._conversations) > self.max_users:
+            self._conversations.popitem(last=False)
+
+
+conversation_cache = ConversationCache()
+
+# Callables run with the user id once a recorded turn is in the database
+turn_listeners = []
+
+
+def _notify(user_ids):
+    for user_id in user_ids:
+        for listener in turn_listeners:
+            try:
+                listener(user_id)
+            except Exception:
+                logger.exception("Turn listener failed for user %s", user_id)
+
+
+class ChatHistoryWriter:
+    """Collects ChatHistory inserts from all requests and bulk-writes them.
+
+    Rows are flushed in one transaction once ``flush_size`` are queued or
+    ``flush_interval`` has passed, whichever comes first. Until then they
+    stay visible through ``pending_for`` so the read path never loses a
+    turn, and ``drain`` (registered with atexit) writes out whatever is
+    left on shutdown, without notifying turn listeners. A batch that fails ``max_retries`` times in a row is
+    logged and dropped rather than retried forever.
+
+    ``generation`` works like a seqlock: it is odd while a flush is
+    committing, and bumped again once the batch has left the queue, so a
+    reader that saw the same even value before and after its database
+    read knows the read and the queue agree.
+    """
+
+    def __init__(self, flush_size=CHAT_FLUSH_SIZE, flush_interval=CHAT_FLUSH_INTERVAL,
+                 max_retries=CHAT_FLUSH_MAX_RETRIES):
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max(1, max_retries)
+        self.app = None
+        self.generation = 0  # odd while a flush is in flight
+        self._pending = []   # [(user_id, role, content)], oldest first
+        self._failures = 0   # consecutive failed attempts at the head batch
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.drain)
+
+    @property
+    def enabled(self):
+        return CHAT_WRITE_BATCHING and self.app is not None and not self._stopping
+
+    def enqueue(self, user_id, turns):
+        with self._cond:
+            self._pending.extend((user_id, t["role"], t["content"]) for t in turns)
+            self._ensure_started()
+            if len(self._pending) >= self.flush_size:
+                self._cond.notify_all()
+
+    def _pending_turns(self, user_id):
+        return [{"role": role, "content": content} for uid, role, content in self._pending if uid == user_id]
+
+    def pending_for(self, user_id, timeout=1.0):
+        """(generation, queued turns), after waiting briefly for an in-flight flush."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.generation % 2 == 0, timeout)
+            return self.generation, self._pending_turns(user_id)
+
+    @contextmanager
+    def paused(self, user_id, timeout=1.0):
+        """Queued turns for ``user_id``; no flush starts or finishes inside the block."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.generation % 2 == 0, timeout)
+            yield self._pending_turns(user_id)
+
+    def wait_flushed(self, user_id, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while any(uid == user_id for uid, _, _ in self._pending):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.flush_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._pending:
+                    if self._stopping:
+                        return
+                    continue
+            self.flush()
+
+    def flush(self):
+        with self._cond:
+            batch = self._pending[:self.flush_size]
+            if not batch:
+                return 0
+            # Readers retry (or wait) until the batch is both committed and dequeued
+            self.generation += 1
+
+        written = False
+        with self.app.app_context():
+            try:
+                with chat_flush_seconds.timer():
+                    db.session.execute(
+                        insert(ChatHistory),
+                        [{"user_id": uid, "role": role, "content": content} for uid, role, content in batch],
+                    )
+                    db.session.commit()
+                chat_rows_written.inc(len(batch))
+                written = True
+            except Exception:
+                db.session.rollback()
+                logger.exception("Failed to write %d chat history rows", len(batch))
+            finally:
+                db.session.remove()
+
+        with self._cond:
+            self._failures = 0 if written else self._failures + 1
+            dropped = self._failures >= self.max_retries
+            if written or dropped:
+                del self._pending[:len(batch)]
+            if dropped:
+                self._failures = 0
+                chat_rows_dropped.inc(len(batch))
+            self.generation += 1
+            self._cond.notify_all()
+
+        user_ids = dict.fromkeys(uid for uid, _, _ in batch)
+        if dropped:
+            logger.error("Dropped %d chat history rows after %d failed writes", len(batch), self.max_retries)
+            # Cached buffers still hold the lost turns; reload them from the database
+            for user_id in user_ids:
+                conversation_cache.forget(user_id)
+        if not written:
+            time.sleep(self.flush_interval)
+            return 0
+
+        # While draining at exit, listeners' executors may already be shut down
+        if not self._stopping:
+            with self.app.app_context():
+                _notify(user_ids)
+        return len(batch)
+
+    def drain(self, timeout=10.0):
+        """Stop accepting background work and write everything still queued."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            if self._thread is None or not self._thread.is_alive():
+                self.flush()
+            else:
+                with self._cond:
+                    self._cond.wait(0.05)
+
+
+chat_writer = ChatHistoryWriter()
+
+
+def record_turn(user_id, user_message, reply):
+    """Persist a user/assistant exchange and keep the cache in step."""
+    turns = [
+        {"role": "user", "content": user_message},
+        {"role": "assistant", "content": reply},
+    ]
+    if chat_writer.enabled:
+        # Off the request path: the writer commits in bulk and then notifies listeners
+        chat_writer.enqueue(user_id, turns)
+        conversation_cache.append(user_id, turns)
+        return
+
+    db.session.add(ChatHistory(user_id=user_id, role="user", content=user_message))
+    db.session.add(ChatHistory(user_id=user_id, role="assistant", content=reply))
+    db.session.commit()
+    conversation_cache.append(user_id, turns)
+    _notify([user_id])
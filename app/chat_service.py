@@ -0,0 +1,176 @@
+# chat_service.py
+#
+# One implementation of a chat turn for every entry point (REST SSE, the
+# GraphQL mutation and subscription, and the asyncio /stream-chat): resolve
+# the user, build the prompt, generate through the shared Ollama slots and
+# record the exchange once the reply is complete.
+
+import logging
+import time
+
+from app import chat_cache
+from app.auth import token_auth
+from app.chat_history import conversation_cache, record_turn
+from app.context_builder import build_messages
+from app.llm_client import LLMBusyError
+from app.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# context: history + summary + document retrieval; first_token and generation
+# are measured from when the stream is opened (so they include the slot wait)
+chat_stage_seconds = Histogram(
+    "chat_stage_seconds", "Time spent in each stage of a chat turn", ["stage"])
+chat_tokens = Counter(
+    "chat_tokens_total", "Reply tokens generated, by entry path", ["path"])
+chat_errors = Counter(
+    "chat_errors_total", "Chat turns that failed, by entry path and kind", ["path", "kind"])
+
+INVALID_USER_MESSAGE = "Invalid user"
+FAILED_MESSAGE = "Sorry, something went wrong while generating a reply."
+
+
+class ChatTurn:
+    """A prepared exchange: the user's message and the prompt built for it."""
+
+    def __init__(self, service, user_id, message, messages):
+        self.service = service
+        self.user_id = user_id
+        self.message = message
+        self.messages = messages
+
+    def record(self, reply):
+        with chat_stage_seconds.timer(stage="record"):
+            record_turn(self.user_id, self.message, reply)
+
+    def _timed(self, tokens, path, started):
+        count = 0
+        for token in tokens:
+            if count == 0:
+                chat_stage_seconds.observe(time.perf_counter() - started, stage="first_token")
+            count += 1
+            yield token
+        chat_stage_seconds.observe(time.perf_counter() - started, stage="generation")
+        chat_tokens.inc(count, path=path)
+
+    def reply(self):
+        """Generate the whole reply and record it.
+
+        LLMBusyError propagates (nothing is recorded); any other failure is
+        recorded as an apology, as the chat mutation always did.
+        """
+        started = time.perf_counter()
+        try:
+            stream = chat_cache.open_chat_stream(self.messages)
+            try:
+                reply = "".join(self._timed(stream, "reply", started))
+            finally:
+                stream.close()
+        except LLMBusyError:
+            chat_errors.inc(path="reply", kind="busy")
+            raise
+        except Exception as e:
+            chat_errors.inc(path="reply", kind="error")
+            logger.error(f"Ollama stream error: {e}")
+            reply = FAILED_MESSAGE
+        self.record(reply)
+        return reply
+
+    def stream(self):
+        """Open a ReplyStream; LLMBusyError is raised here, before any response starts."""
+        started = time.perf_counter()
+        try:
+            stream = chat_cache.open_chat_stream(self.messages)
+        except LLMBusyError:
+            chat_errors.inc(path="stream", kind="busy")
+            raise
+        return ReplyStream(self, self._timed(stream, "stream", started), stream)
+
+    async def astream(self):
+        """Async token generator on the event loop's Ollama client.
+
+        The first ``__anext__`` waits for a slot and may raise LLMBusyError.
+        """
+        import anyio
+
+        tokens = []
+        started = time.perf_counter()
+        stream = chat_cache.astream_chat(self.messages)
+        try:
+            async for token in stream:
+                if not tokens:
+                    chat_stage_seconds.observe(time.perf_counter() - started, stage="first_token")
+                tokens.append(token)
+                yield token
+            chat_stage_seconds.observe(time.perf_counter() - started, stage="generation")
+            chat_tokens.inc(len(tokens), path="async")
+            await anyio.to_thread.run_sync(self.service.in_app_context, self.record, "".join(tokens))
+        except LLMBusyError:
+            chat_errors.inc(path="async", kind="busy")
+            raise
+        finally:
+            await stream.aclose()
+
+
+class ReplyStream:
+    """Token iterator that records its turn once exhausted.
+
+    Closing it early releases the Ollama slot without recording a partial reply.
+    """
+
+    def __init__(self, turn, tokens, stream):
+        self.turn = turn
+        self._tokens = tokens
+        self._stream = stream
+
+    def __iter__(self):
+        tokens = []
+        for token in self._tokens:
+            tokens.append(token)
+            yield token
+        self.turn.record("".join(tokens))
+
+    def close(self):
+        self._stream.close()
+
+
+class ChatService:
+    def __init__(self):
+        self.app = None
+
+    def init_app(self, app):
+        self.app = app
+
+    def in_app_context(self, fn, *args):
+        # Worker threads used by the async paths have no app context of their own
+        with self.app.app_context():
+            return fn(*args)
+
+    def user_id(self, username=None, token=None):
+        """The caller's user id: from a login token when one is given, else by username."""
+        if token:
+            return token_auth.user_id(token)
+        if username:
+            return conversation_cache.user_id(username)
+        return None
+
+    def start(self, user_id, message, document_id=None):
+        """Prepare a turn for ``user_id``, or None if the caller wasn't identified."""
+        if user_id is None:
+            return None
+        # Recent turns within the token budget, plus a summary of older ones
+        # (and the most relevant chunks of an uploaded PDF when document_id is set)
+        with chat_stage_seconds.timer(stage="context"):
+            messages = build_messages(user_id, message, document_id=document_id)
+        return ChatTurn(self, user_id, message, messages)
+
+    async def astart(self, message, document_id=None, username=None, token=None):
+        import anyio
+
+        def start():
+            return self.start(self.user_id(username, token), message, document_id)
+
+        return await anyio.to_thread.run_sync(self.in_app_context, start)
+
+
+chat_service = ChatService()
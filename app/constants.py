@@ -1,3 +1,8 @@
+import os
+
+# Waitress serves requests on this many threads (its default is 4)
+WAITRESS_THREADS = int(os.environ.get("WAITRESS_THREADS", 4))
+
 PLAYGROUND_HTML = """
 <!DOCTYPE html>
 <html>
@@ -0,0 +1,234 @@
+# context_builder.py
+#
+# Builds the prompt for a chat turn within a token budget: as many recent
+# turns as fit, plus a rolling summary of everything older. The summary is
+# kept in ChatSummary and brought up to date in the background after turns
+# are recorded, so prompt size stays bounded however long a chat gets.
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+
+from app import llm_client
+from app.chat_history import CONVERSATION_CACHE_TURNS, conversation_cache, turn_listeners
+from app.doc_index import DOC_TOP_K, document_store
+from app.models import db, ChatHistory, ChatSummary
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "You are Tintu 🧸, a helpful bot."
+
+# Prompt budget (system prompt + summary + history + new message)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1024))
+# Most recent turns ever sent verbatim; older ones only reach the model via the summary
+CONTEXT_MAX_TURNS = min(int(os.environ.get("CONTEXT_MAX_TURNS", 20)), CONVERSATION_CACHE_TURNS)
+# Room assumed for the new message when sizing the verbatim window
+CONTEXT_MESSAGE_RESERVE = int(os.environ.get("CONTEXT_MESSAGE_RESERVE_TOKENS", 128))
+# Separate budget for retrieved document excerpts when chatting with a PDF
+DOC_CONTEXT_TOKENS = int(os.environ.get("DOC_CONTEXT_TOKENS", 1024))
+SUMMARY_MAX_TOKENS = int(os.environ.get("SUMMARY_MAX_TOKENS", 200))
+# Turns folded into the summary per background pass
+SUMMARY_BATCH = 40
+SUMMARY_CACHE_USERS = 10000
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Merge the new messages into the current summary. Keep names, facts, preferences and "
+    f"open questions; drop small talk. Reply with the updated summary only, under {SUMMARY_MAX_TOKENS} tokens."
+)
+SUMMARY_NOTE = "Summary of the earlier conversation:\n"
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text; cheap and good enough for budgeting
+    return len(text) // 4 + 1
+
+
+def select_turns(turns, budget):
+    """Newest turns (kept in chronological order) whose estimated size fits ``budget``."""
+    selected = []
+    for turn in reversed(turns):
+        cost = estimate_tokens(turn["content"])
+        if cost > budget:
+            break
+        budget -= cost
+        selected.append(turn)
+    selected.reverse()
+    return selected
+
+
+def history_budget(budget=CONTEXT_TOKEN_BUDGET):
+    """Tokens always available for verbatim turns.
+
+    What is left of ``budget`` after the system prompt, a full-size summary
+    and the new-message reserve. The summarizer folds in everything older
+    than the turns that fit here and build_messages never sends fewer, so
+    once the summary has caught up every turn is in one or the other.
+    """
+    fixed = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(SUMMARY_NOTE) + SUMMARY_MAX_TOKENS
+    return max(0, budget - fixed - CONTEXT_MESSAGE_RESERVE)
+
+
+class RollingSummarizer:
+    """Keeps ChatSummary rows up to date on a single background thread."""
+
+    def __init__(self, keep_turns=CONTEXT_MAX_TURNS, window_budget=None):
+        self.keep_turns = keep_turns
+        self.window_budget = history_budget() if window_budget is None else window_budget
+        self.app = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+        self._pending = set()
+        self._summaries = OrderedDict()  # user id -> (content, last_message_id)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        turn_listeners.append(self.schedule)
+
+    def schedule(self, user_id):
+        if self.app is None:
+            return
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+        self._executor.submit(self._run, user_id)
+
+    def _run(self, user_id):
+        with self._lock:
+            self._pending.discard(user_id)
+        with self.app.app_context():
+            try:
+                if self.update(user_id):
+                    self.schedule(user_id)
+            except llm_client.LLMBusyError:
+                # Ollama is saturated with live chats; catch up after a later turn
+                pass
+            except Exception:
+                logger.exception("Failed to update chat summary for user %s", user_id)
+            finally:
+                db.session.remove()
+
+    def summary(self, user_id):
+        with self._lock:
+            cached = self._summaries.get(user_id)
+            if cached is not None:
+                self._summaries.move_to_end(user_id)
+                return cached
+        row = db.session.execute(
+            select(ChatSummary.content, ChatSummary.last_message_id).where(ChatSummary.user_id == user_id)
+        ).first()
+        summary = (row[0], row[1]) if row else ("", 0)
+        self._remember(user_id, summary)
+        return summary
+
+    def _remember(self, user_id, summary):
+        with self._lock:
+            self._summaries[user_id] = summary
+            self._summaries.move_to_end(user_id)
+            while len(self._summaries) > SUMMARY_CACHE_USERS:
+                self._summaries.popitem(last=False)
+
+    def update(self, user_id):
+        """Fold turns older than the verbatim window into the summary.
+
+        The window is the newest turns (at most ``keep_turns``) that fit
+        ``window_budget``, the same ones build_messages always sends.
+        Returns True when more turns are waiting to be folded in.
+        """
+        content, last_id = self.summary(user_id)
+
+        recent = db.session.execute(
+            select(ChatHistory.id, ChatHistory.content)
+            .where(ChatHistory.user_id == user_id)
+            .order_by(ChatHistory.id.desc())
+            .limit(self.keep_turns + 1)
+        ).all()
+        window = select_turns([{"content": text} for _, text in reversed(recent)], self.window_budget)
+        kept = min(len(window), self.keep_turns)
+        if kept == len(recent):
+            return False
+        # Everything up to this id is outside the window
+        boundary = recent[kept][0]
+        if boundary <= last_id:
+            return False
+
+        rows = db.session.execute(
+            select(ChatHistory.id, ChatHistory.role, ChatHistory.content)
+            .where(ChatHistory.user_id == user_id, ChatHistory.id > last_id, ChatHistory.id <= boundary)
+            .order_by(ChatHistory.id.asc())
+            .limit(SUMMARY_BATCH)
+        ).all()
+        if not rows:
+            return False
+
+        transcript = "\n".join(f"{role}: {text}" for _, role, text in rows)
+        new_content = llm_client.chat(
+            [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Current summary:\n{content or '(none)'}\n\nNew messages:\n{transcript}"},
+            ],
+            options={"num_predict": SUMMARY_MAX_TOKENS, "temperature": 0.2},
+        ).strip()
+        new_last_id = rows[-1][0]
+
+        row = db.session.get(ChatSummary, user_id)
+        if row is None:
+            row = ChatSummary(user_id=user_id)
+            db.session.add(row)
+        row.content = new_content
+        row.last_message_id = new_last_id
+        db.session.commit()
+
+        self._remember(user_id, (new_content, new_last_id))
+        return len(rows) == SUMMARY_BATCH
+
+
+summarizer = RollingSummarizer()
+
+
+def document_context(document_id, user_input, budget=DOC_CONTEXT_TOKENS):
+    """System note with the document chunks most relevant to ``user_input``, or None."""
+    excerpts = []
+    for chunk in document_store.search(document_id, user_input, k=DOC_TOP_K):
+        excerpt = f"[page {chunk['page']}] {chunk['text']}"
+        cost = estimate_tokens(excerpt)
+        if cost > budget:
+            break
+        budget -= cost
+        excerpts.append(excerpt)
+    if not excerpts:
+        return None
+    return "Answer using these excerpts from the user's document:\n\n" + "\n\n".join(excerpts)
+
+
+def build_messages(user_id, user_input, budget=CONTEXT_TOKEN_BUDGET, document_id=None):
+    """System prompt, rolling summary, recent turns that fit, then the new message.
+
+    With ``document_id`` the top-k matching chunks of that PDF are added too,
+    within their own DOC_CONTEXT_TOKENS budget.
+    """
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    budget -= estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(user_input)
+
+    if document_id:
+        note = document_context(document_id, user_input)
+        if note:
+            messages.append({"role": "system", "content": note})
+
+    summary, _ = summarizer.summary(user_id)
+    if summary:
+        note = SUMMARY_NOTE + summary
+        messages.append({"role": "system", "content": note})
+        budget -= estimate_tokens(note)
+
+    turns = conversation_cache.recent(user_id, limit=CONTEXT_MAX_TURNS)
+    # Never fewer turns than the summary assumes, even if a long message
+    # pushes the prompt past the budget
+    messages += select_turns(turns, max(budget, summarizer.window_budget))
+    messages.append({"role": "user", "content": user_input})
+    return messages
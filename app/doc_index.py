@@ -0,0 +1,145 @@
+# doc_index.py
+#
+# Chat-with-your-PDF retrieval: extracted pages are split into overlapping
+# chunks, embedded through Ollama and stored per document as a normalized
+# float32 matrix (.npy, memory-mapped on load) next to a JSON list of the
+# chunk texts. Chat looks up the top-k chunks by cosine similarity instead
+# of pasting the whole document into the prompt.
+
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app import llm_client
+
+logger = logging.getLogger(__name__)
+
+DOC_INDEX_DIR = os.environ.get("DOC_INDEX_DIR", "./doc_index")
+CHUNK_CHARS = int(os.environ.get("DOC_CHUNK_CHARS", 1200))
+CHUNK_OVERLAP = int(os.environ.get("DOC_CHUNK_OVERLAP", 200))
+EMBED_BATCH = 32
+DOC_TOP_K = int(os.environ.get("DOC_TOP_K", 4))
+# Loaded (memory-mapped) indexes kept open at once
+OPEN_INDEXES = 64
+
+_DOC_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+def chunk_pages(pages, chunk_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Split page records into overlapping chunks that never span pages."""
+    step = max(1, chunk_chars - overlap)
+    chunks = []
+    for page in pages:
+        text = " ".join(page["content"].split())
+        for start in range(0, len(text), step):
+            piece = text[start:start + chunk_chars]
+            if piece.strip():
+                chunks.append({"page": page["page"], "text": piece})
+            if start + chunk_chars >= len(text):
+                break
+    return chunks
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class DocumentStore:
+    def __init__(self, directory=DOC_INDEX_DIR, embed_fn=None):
+        self.directory = directory
+        self.embed_fn = embed_fn or llm_client.embed
+        self._open = OrderedDict()  # doc id -> (vectors, chunks)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="doc-index")
+        self._indexing = set()
+
+    def _paths(self, doc_id):
+        if not _DOC_ID.match(doc_id or ""):
+            raise ValueError("Invalid document id")
+        base = os.path.join(self.directory, doc_id)
+        return base + ".npy", base + ".json"
+
+    def has(self, doc_id):
+        try:
+            vectors_path, chunks_path = self._paths(doc_id)
+        except ValueError:
+            return False
+        return os.path.exists(vectors_path) and os.path.exists(chunks_path)
+
+    def _embed(self, texts):
+        vectors = []
+        for start in range(0, len(texts), EMBED_BATCH):
+            vectors.extend(self.embed_fn(texts[start:start + EMBED_BATCH]))
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+    def index(self, doc_id, pages):
+        """Chunk, embed and persist a document. Re-indexing an id is a no-op."""
+        if self.has(doc_id):
+            return
+        chunks = chunk_pages(pages)
+        if not chunks:
+            return
+        vectors = self._embed([c["text"] for c in chunks])
+
+        os.makedirs(self.directory, exist_ok=True)
+        vectors_path, chunks_path = self._paths(doc_id)
+        # Write under temp names and rename, so readers never see half a document
+        np.save(vectors_path + ".tmp.npy", vectors)
+        with open(chunks_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+        os.replace(chunks_path + ".tmp", chunks_path)
+        os.replace(vectors_path + ".tmp.npy", vectors_path)
+
+    def index_async(self, doc_id, pages):
+        with self._lock:
+            if doc_id in self._indexing or self.has(doc_id):
+                return
+            self._indexing.add(doc_id)
+        self._executor.submit(self._index_job, doc_id, pages)
+
+    def _index_job(self, doc_id, pages):
+        try:
+            self.index(doc_id, pages)
+        except Exception:
+            logger.exception("Failed to index document %s", doc_id)
+        finally:
+            with self._lock:
+                self._indexing.discard(doc_id)
+
+    def _load(self, doc_id):
+        with self._lock:
+            loaded = self._open.get(doc_id)
+            if loaded is not None:
+                self._open.move_to_end(doc_id)
+                return loaded
+        vectors_path, chunks_path = self._paths(doc_id)
+        vectors = np.load(vectors_path, mmap_mode="r")
+        with open(chunks_path, encoding="utf-8") as f:
+            chunks = json.load(f)
+        with self._lock:
+            self._open[doc_id] = (vectors, chunks)
+            while len(self._open) > OPEN_INDEXES:
+                self._open.popitem(last=False)
+        return vectors, chunks
+
+    def search(self, doc_id, query, k=DOC_TOP_K):
+        """Top-k chunks for ``query`` as dicts with page, text and score."""
+        if not self.has(doc_id):
+            return []
+        vectors, chunks = self._load(doc_id)
+        query_vector = self._embed([query])[0]
+        scores = vectors @ query_vector
+        k = min(k, len(chunks))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(chunks[i], score=float(scores[i])) for i in top]
+
+
+document_store = DocumentStore()
@@ -0,0 +1,327 @@
+# graphql_exec.py
+#
+# Execution wrapper for POST /graphql:
+#   - parsed and validated documents are cached (LRU) by the SHA-256 of the
+#     query text, which is also the Apollo persisted-query hash, so clients
+#     may send {"extensions": {"persistedQuery": {"sha256Hash": ...}}} alone;
+#   - depth and cost limits are enforced during validation;
+#   - getUser/getChatHistory fields in one operation are loaded in batches.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from ariadne import graphql_sync
+from ariadne.validation import cost_validator
+from graphql import (
+    FieldNode, FragmentSpreadNode, GraphQLError, InlineFragmentNode, OperationDefinitionNode,
+    OperationType, ValidationRule, parse, validate
+)
+from graphql.utilities import value_from_ast_untyped
+from sqlalchemy import select
+
+from app.chat_history import history_pages
+from app.metrics import Counter, Histogram
+from app.models import db, User
+
+logger = logging.getLogger(__name__)
+
+GRAPHQL_DEBUG = os.environ.get("GRAPHQL_DEBUG", "0") == "1"
+GRAPHQL_DOCUMENT_CACHE_SIZE = int(os.environ.get("GRAPHQL_DOCUMENT_CACHE_SIZE", 1000))
+GRAPHQL_MAX_DEPTH = int(os.environ.get("GRAPHQL_MAX_DEPTH", 10))
+GRAPHQL_MAX_COST = int(os.environ.get("GRAPHQL_MAX_COST", 1000))
+# Optional JSON file of {sha256: query}; these are never evicted
+PERSISTED_QUERIES_FILE = os.environ.get("PERSISTED_QUERIES_FILE")
+
+# Fields not listed cost 1; multipliers scale a field's cost by its page size
+COST_MAP = {
+    "Query": {
+        "getChatHistory": {"complexity": 1, "multipliers": ["first"]},
+    },
+    "Mutation": {
+        "register": {"complexity": 10},
+        "login": {"complexity": 10},
+        "chat": {"complexity": 50},
+        "extractPDFText": {"complexity": 50},
+        "styleTransfer": {"complexity": 100},
+    },
+}
+
+
+graphql_operation_seconds = Histogram(
+    "graphql_operation_seconds", "GraphQL execution time by operation (type and root fields)", ["operation"])
+graphql_errors = Counter(
+    "graphql_errors_total", "GraphQL responses carrying errors, by operation", ["operation"])
+graphql_document_cache_events = Counter(
+    "graphql_document_cache_total", "Parsed-document cache lookups by result", ["result"])
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+def depth_limit_rule(max_depth):
+    class DepthLimitRule(ValidationRule):
+        def enter_operation_definition(self, node, *_args):
+            depth = self._depth(node.selection_set, 0, frozenset())
+            if depth > max_depth:
+                self.report_error(GraphQLError(
+                    f"Query depth {depth} exceeds the limit of {max_depth}.", node))
+
+        def _depth(self, selection_set, depth, fragments):
+            if selection_set is None:
+                return depth
+            deepest = depth
+            for selection in selection_set.selections:
+                if isinstance(selection, FieldNode):
+                    # Introspection (the playground's schema query) is exempt
+                    if not selection.name.value.startswith("__"):
+                        deepest = max(deepest, self._depth(selection.selection_set, depth + 1, fragments))
+                elif isinstance(selection, InlineFragmentNode):
+                    deepest = max(deepest, self._depth(selection.selection_set, depth, fragments))
+                elif isinstance(selection, FragmentSpreadNode):
+                    name = selection.name.value
+                    fragment = self.context.get_fragment(name)
+                    if fragment is not None and name not in fragments:
+                        deepest = max(deepest, self._depth(fragment.selection_set, depth, fragments | {name}))
+            return deepest
+
+    return DepthLimitRule
+
+
+class _CachedDocument:
+    __slots__ = ("query", "document", "errors")
+
+    def __init__(self, query, document):
+        self.query = query
+        self.document = document
+        self.errors = None  # validation errors, once validated
+
+
+class DocumentCache:
+    """LRU of query text -> parsed document + static validation result."""
+
+    def __init__(self, max_size=GRAPHQL_DOCUMENT_CACHE_SIZE):
+        self.max_size = max(1, max_size)
+        self._entries = OrderedDict()  # sha256 -> _CachedDocument
+        self._pinned = {}              # sha256 -> query, from PERSISTED_QUERIES_FILE
+        self._lock = threading.Lock()
+
+    def load_persisted(self, path):
+        with open(path, encoding="utf-8") as f:
+            queries = json.load(f)
+        for sha256, query in queries.items():
+            if query_hash(query) != sha256:
+                raise ValueError(f"Persisted query {sha256} does not match its text")
+        self._pinned.update(queries)
+
+    def query_for(self, sha256):
+        """Query text previously seen (or pinned) for a hash, or None."""
+        with self._lock:
+            entry = self._entries.get(sha256)
+            if entry is not None:
+                return entry.query
+        return self._pinned.get(sha256)
+
+    def get(self, query, sha256=None):
+        sha256 = sha256 or query_hash(query)
+        with self._lock:
+            entry = self._entries.get(sha256)
+            if entry is not None:
+                self._entries.move_to_end(sha256)
+                graphql_document_cache_events.inc(result="hit")
+                return entry
+        graphql_document_cache_events.inc(result="miss")
+        # Parse outside the lock; syntax errors propagate as GraphQLError and aren't cached
+        entry = _CachedDocument(query, parse(query))
+        with self._lock:
+            entry = self._entries.setdefault(sha256, entry)
+            self._entries.move_to_end(sha256)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+
+document_cache = DocumentCache()
+if PERSISTED_QUERIES_FILE:
+    document_cache.load_persisted(PERSISTED_QUERIES_FILE)
+
+_static_rules = (depth_limit_rule(GRAPHQL_MAX_DEPTH),)
+
+
+def select_operation(document, operation_name=None):
+    for definition in document.definitions:
+        if isinstance(definition, OperationDefinitionNode):
+            if operation_name is None or (definition.name and definition.name.value == operation_name):
+                return definition
+    return None
+
+
+def operation_label(document, operation_name=None):
+    """Metrics label such as "mutation chat" or "query getChatHistory,getUser".
+
+    Built from the schema's root fields rather than the client's operation
+    name, so the number of distinct labels stays bounded.
+    """
+    operation = select_operation(document, operation_name)
+    if operation is None:
+        return "unknown"
+    fields = sorted({s.name.value for s in operation.selection_set.selections if isinstance(s, FieldNode)})
+    return f"{operation.operation.value} {','.join(fields)}"
+
+
+class OperationLoaders:
+    """Per-operation batch loading for getUser and getChatHistory.
+
+    Passed to resolvers as the root value. The first lookup scans the
+    operation's top-level fields and loads every user and history page
+    they ask for at once, so N aliased fields cost one query each, not N.
+    """
+
+    def __init__(self, document=None, operation_name=None, variables=None):
+        self.document = document
+        self.operation_name = operation_name
+        self.variables = variables or {}
+        self._users = {}   # username -> User or None
+        self._pages = {}   # (user_id, first, after) -> page
+        self._scanned = document is None
+
+    def _root_fields(self):
+        operation = select_operation(self.document, self.operation_name)
+        if operation is None or operation.operation != OperationType.QUERY:
+            return
+        fragments = {d.name.value: d for d in self.document.definitions if not isinstance(d, OperationDefinitionNode)}
+        pending = list(operation.selection_set.selections)
+        while pending:
+            selection = pending.pop()
+            if isinstance(selection, FieldNode):
+                args = {a.name.value: value_from_ast_untyped(a.value, self.variables) for a in selection.arguments}
+                yield selection.name.value, args
+            elif isinstance(selection, InlineFragmentNode):
+                pending.extend(selection.selection_set.selections)
+            elif isinstance(selection, FragmentSpreadNode) and selection.name.value in fragments:
+                pending.extend(fragments[selection.name.value].selection_set.selections)
+
+    def _scan(self):
+        self._scanned = True
+        try:
+            fields = list(self._root_fields())
+        except Exception:
+            logger.exception("Could not scan GraphQL operation for batching")
+            return
+        usernames = {args["username"] for name, args in fields
+                     if name in ("getUser", "getChatHistory") and isinstance(args.get("username"), str)}
+        self._load_users(usernames)
+
+        # History of callers identified by username only; token callers are resolved per field
+        pages = []
+        for name, args in fields:
+            user = self._users.get(args.get("username"))
+            if name == "getChatHistory" and user is not None and not args.get("token"):
+                pages.append((user.id, args.get("first"), args.get("after")))
+        if pages:
+            self._pages.update(history_pages(pages))
+
+    def _load_users(self, usernames):
+        usernames = [u for u in usernames if u not in self._users]
+        if not usernames:
+            return
+        found = {user.username: user for user in db.session.execute(
+            select(User).where(User.username.in_(usernames))).scalars()}
+        for username in usernames:
+            self._users[username] = found.get(username)
+
+    def user(self, username):
+        if not self._scanned:
+            self._scan()
+        self._load_users([username])
+        return self._users[username]
+
+    def history(self, user_id, first=None, after=None):
+        if not self._scanned:
+            self._scan()
+        key = (user_id, first, after)
+        if key not in self._pages:
+            self._pages.update(history_pages([key]))
+        return self._pages[key]
+
+
+def loaders_for(info):
+    # Resolvers reached outside execute() (e.g. subscriptions) get an empty loader
+    root = info.root_value
+    return root if isinstance(root, OperationLoaders) else OperationLoaders()
+
+
+def _persisted_query(data):
+    """Resolve Apollo-style persisted queries; returns (query, error response)."""
+    extension = (data.get("extensions") or {}).get("persistedQuery")
+    query = data.get("query")
+    if not extension:
+        return query, None
+    sha256 = extension.get("sha256Hash")
+    if query:
+        if query_hash(query) != sha256:
+            return None, {"errors": [{"message": "provided sha does not match query"}]}
+        return query, None
+    query = document_cache.query_for(sha256)
+    if query is None:
+        return None, {"errors": [{"message": "PersistedQueryNotFound",
+                                  "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"}}]}
+    return query, None
+
+
+def execute(schema, data, context_value=None):
+    """Run a GraphQL request body; returns (success, result) like graphql_sync."""
+    if not isinstance(data, dict):
+        return graphql_sync(schema, data, context_value=context_value, debug=GRAPHQL_DEBUG)
+
+    query, error = _persisted_query(data)
+    if error is not None:
+        return False, error
+    if not isinstance(query, str):
+        return graphql_sync(schema, data, context_value=context_value, debug=GRAPHQL_DEBUG)
+    data = dict(data, query=query)
+
+    try:
+        entry = document_cache.get(query)
+    except GraphQLError:
+        # Let ariadne report the syntax error in its usual format
+        return graphql_sync(schema, data, context_value=context_value, debug=GRAPHQL_DEBUG)
+
+    variables = data.get("variables") or {}
+    cost_rule = cost_validator(
+        maximum_cost=GRAPHQL_MAX_COST, default_cost=1, variables=variables, cost_map=COST_MAP)
+
+    def parse_cached(_context, _data):
+        return entry.document
+
+    def validate_cached(schema, document_ast, rules=None, max_errors=None, type_info=None):
+        # The schema and static rules never change, so a document validates the same every time
+        if entry.errors is None:
+            entry.errors = validate(schema, document_ast, tuple(rules or ()) + _static_rules,
+                                    max_errors=max_errors, type_info=type_info)
+        if entry.errors:
+            return entry.errors
+        # Cost depends on variables (page sizes), so it's checked per request
+        return validate(schema, document_ast, [cost_rule])
+
+    loaders = OperationLoaders(entry.document, data.get("operationName"), variables)
+    label = operation_label(entry.document, data.get("operationName"))
+    started = time.perf_counter()
+    success, result = graphql_sync(
+        schema,
+        data,
+        context_value=context_value,
+        root_value=loaders,
+        query_parser=parse_cached,
+        query_validator=validate_cached,
+        debug=GRAPHQL_DEBUG,
+    )
+    graphql_operation_seconds.observe(time.perf_counter() - started, operation=label)
+    if not success or result.get("errors"):
+        graphql_errors.inc(operation=label)
+    return success, result
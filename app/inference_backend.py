@@ -0,0 +1,93 @@
+# inference_backend.py
+
+import glob
+import os
+
+import torch
+
+from app.constants import WAITRESS_THREADS
+
+# eager | channels_last | torchscript | int8
+INFERENCE_BACKEND = os.environ.get("STYLE_BACKEND", "eager")
+BACKENDS = ("eager", "channels_last", "torchscript", "int8")
+
+# Intra-op threads per inference; defaults to an even share of the cores
+TORCH_NUM_THREADS = int(os.environ.get(
+    "TORCH_NUM_THREADS", max(1, (os.cpu_count() or 1) // WAITRESS_THREADS)
+))
+
+# Optional folder of sample images for int8 calibration
+CALIBRATION_DIR = os.environ.get("STYLE_CALIBRATION_DIR")
+
+
+def configure_torch_threads(num_threads=TORCH_NUM_THREADS):
+    """Pin torch's thread pools so concurrent requests don't oversubscribe cores."""
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before any parallel work has run
+        pass
+
+
+class ChannelsLast(torch.nn.Module):
+    """Runs the wrapped model on NHWC tensors, returning a contiguous NCHW result."""
+
+    def __init__(self, model):
+        super(ChannelsLast, self).__init__()
+        self.model = model.to(memory_format=torch.channels_last)
+
+    def forward(self, x):
+        out = self.model(x.contiguous(memory_format=torch.channels_last))
+        return out.contiguous()
+
+
+def _example_input(size=256):
+    return torch.rand(1, 3, size, size) * 255
+
+
+def _calibration_inputs(limit=8):
+    if CALIBRATION_DIR:
+        from PIL import Image
+        from app.style_transfer import preprocess_image
+        paths = sorted(glob.glob(os.path.join(CALIBRATION_DIR, "*")))[:limit]
+        inputs = [preprocess_image(Image.open(p).convert("RGB"), 256).unsqueeze(0) for p in paths]
+        if inputs:
+            return inputs
+    return [_example_input() for _ in range(limit)]
+
+
+def to_torchscript(model):
+    # Tracing (not scripting) because UpsampleConvLayer keeps an Optional upsample attr
+    with torch.no_grad():
+        traced = torch.jit.trace(model, _example_input(), check_trace=False)
+    frozen = torch.jit.freeze(traced.eval())
+    return torch.jit.optimize_for_inference(frozen)
+
+
+def to_int8(model):
+    """Static int8 quantization of the conv layers via FX graph mode."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = "fbgemm"
+    qconfig_mapping = get_default_qconfig_mapping("fbgemm")
+    prepared = prepare_fx(model, qconfig_mapping, example_inputs=(_example_input(),))
+    with torch.no_grad():
+        for sample in _calibration_inputs():
+            prepared(sample)
+    return convert_fx(prepared).eval()
+
+
+def prepare_model(model, backend=INFERENCE_BACKEND):
+    """Turn an eager TransformerNet into the selected inference backend."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+    model.eval()
+    if backend == "channels_last":
+        return ChannelsLast(model)
+    if backend == "torchscript":
+        return to_torchscript(model)
+    if backend == "int8":
+        return to_int8(model)
+    return model
@@ -0,0 +1,187 @@
+# llm_client.py
+#
+# Shared Ollama access for every chat path: one pooled keep-alive client,
+# explicit timeouts, and a per-model concurrency limit so an overloaded
+# Ollama answers "busy" quickly instead of piling up stuck request threads.
+
+import os
+import threading
+import time
+
+import httpx
+import ollama
+
+from app.metrics import Counter, Gauge, Histogram
+
+MODEL_NAME = os.environ.get("OLLAMA_MODEL", "my-chat")
+EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST")  # None -> ollama's default
+
+CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", 120))
+POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", 32))
+KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", 60))
+
+# Generations allowed to reach Ollama at once, per model
+MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 4))
+# How long a request may wait for a slot before we answer "busy"
+QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", 10))
+
+DEFAULT_OPTIONS = {
+    "num_predict": 200,
+    "temperature": 0.7
+}
+
+BUSY_MESSAGE = "Server busy, please try again in a moment."
+
+queue_wait_seconds = Histogram(
+    "llm_queue_wait_seconds", "Time spent waiting for an Ollama slot", ["model"])
+inflight_generations = Gauge(
+    "llm_inflight_generations", "Generations currently running on Ollama", ["model"])
+busy_rejections = Counter(
+    "llm_busy_rejections_total", "Requests rejected because no Ollama slot freed up", ["model"])
+llm_requests = Counter(
+    "llm_requests_total", "Ollama chat requests by outcome", ["model", "outcome"])
+
+
+class LLMBusyError(Exception):
+    pass
+
+
+def _http_options():
+    return {
+        "timeout": httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=POOL_SIZE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+client = ollama.Client(host=OLLAMA_HOST, **_http_options())
+_async_client = None
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def _semaphore(model):
+    with _semaphores_lock:
+        if model not in _semaphores:
+            _semaphores[model] = threading.BoundedSemaphore(MAX_CONCURRENCY)
+        return _semaphores[model]
+
+
+def acquire_slot(model=MODEL_NAME, timeout=QUEUE_TIMEOUT):
+    """Block until ``model`` has a free generation slot or raise LLMBusyError."""
+    start = time.perf_counter()
+    acquired = _semaphore(model).acquire(timeout=timeout)
+    queue_wait_seconds.observe(time.perf_counter() - start, model=model)
+    if not acquired:
+        busy_rejections.inc(model=model)
+        raise LLMBusyError(BUSY_MESSAGE)
+    inflight_generations.inc(model=model)
+
+
+def release_slot(model=MODEL_NAME):
+    inflight_generations.dec(model=model)
+    _semaphore(model).release()
+
+
+class ChatStream:
+    """Iterator of reply tokens that holds a model slot until exhausted or closed.
+
+    The slot is taken when the stream is opened (so "busy" surfaces before
+    any response is started) and released exactly once.
+    """
+
+    def __init__(self, messages, model=MODEL_NAME, options=None):
+        self.model = model
+        acquire_slot(model)
+        self._released = False
+        try:
+            self._chunks = client.chat(
+                model=model,
+                messages=messages,
+                stream=True,
+                options=options or DEFAULT_OPTIONS,
+            )
+        except Exception:
+            self._chunks = None
+            self._finish("error")
+            raise
+
+    def __iter__(self):
+        outcome = "error"
+        try:
+            for chunk in self._chunks:
+                yield chunk['message']['content']
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "closed"
+            raise
+        finally:
+            self._finish(outcome)
+
+    def _finish(self, outcome):
+        if not self._released:
+            self._released = True
+            llm_requests.inc(model=self.model, outcome=outcome)
+            release_slot(self.model)
+            if outcome != "ok" and hasattr(self._chunks, "close"):
+                self._chunks.close()
+
+    def close(self):
+        self._finish("closed")
+
+
+def open_chat_stream(messages, model=MODEL_NAME, options=None):
+    return ChatStream(messages, model=model, options=options)
+
+
+def chat(messages, model=MODEL_NAME, options=None):
+    """Run a full generation and return the reply text."""
+    stream = open_chat_stream(messages, model=model, options=options)
+    try:
+        return "".join(stream)
+    finally:
+        stream.close()
+
+
+def embed(texts, model=EMBED_MODEL):
+    """Embedding vectors for a list of texts from the local Ollama server."""
+    response = client.embed(model=model, input=texts)
+    return response["embeddings"]
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = ollama.AsyncClient(host=OLLAMA_HOST, **_http_options())
+    return _async_client
+
+
+async def astream_chat(messages, model=MODEL_NAME, options=None):
+    """Async token generator sharing the same per-model slots as the sync path.
+
+    The first ``__anext__`` waits for a slot (in a worker thread, so the
+    event loop stays free) and raises LLMBusyError if none frees up.
+    """
+    import anyio
+
+    await anyio.to_thread.run_sync(acquire_slot, model)
+    outcome = "error"
+    try:
+        stream = await get_async_client().chat(
+            model=model,
+            messages=messages,
+            stream=True,
+            options=options or DEFAULT_OPTIONS,
+        )
+        async for chunk in stream:
+            yield chunk['message']['content']
+        outcome = "ok"
+    finally:
+        llm_requests.inc(model=model, outcome=outcome)
+        release_slot(model)
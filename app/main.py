@@ -1,25 +1,39 @@
 from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
-from ariadne import graphql_sync
+from flask_migrate import Migrate
+from ariadne import format_error, subscribe
 from app.constants import PLAYGROUND_HTML
-from app.models import db, User, ChatHistory
+from app.models import db
+from app.db_config import configure_database
+from app.context_builder import summarizer
+from app.chat_history import chat_writer
+from app.auth import bearer_token
+from app.chat_service import INVALID_USER_MESSAGE, chat_service
 from app.schema import schema
+from app.graphql_exec import execute as execute_graphql
+from app import observability, uploads
 from app.pdf_upload import pdf_bp
 from ariadne.file_uploads import combine_multipart_data
+from app.llm_client import LLMBusyError
+from app.metrics import render_metrics
+import asyncio
 import json
-import ollama
 import os
 
-MODEL_NAME = "my-chat"
-
 UPLOAD_DIR = "./uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 my_app = Flask(__name__)
 CORS(my_app)  # ✅ Allow React frontend to call APIs
+observability.init_app(my_app)  # per-route latency histograms, optional trace ids (TRACE_IDS=1)
+uploads.init_app(my_app)  # MAX_CONTENT_LENGTH + uploads spooled to temp files on disk
 
-my_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///database.db"
+configure_database(my_app)  # DATABASE_URL, defaults to sqlite:///database.db
 db.init_app(my_app)
+migrate = Migrate(my_app, db)
+summarizer.init_app(my_app)
+chat_writer.init_app(my_app)
+chat_service.init_app(my_app)
 my_app.register_blueprint(pdf_bp)
 
 with my_app.app_context():
@@ -43,56 +57,87 @@ def graphql_server():
     else:
         data = request.get_json()
 
-    success, result = graphql_sync(schema, data, context_value=request, debug=True)
+    # Cached parse/validation, persisted queries, depth/cost limits, batched loads
+    success, result = execute_graphql(schema, data, context_value=request)
     status_code = 200 if success else 400
     return jsonify(result), status_code
 
+@my_app.route("/graphql/stream", methods=["POST"])
+def graphql_stream():
+    """GraphQL subscriptions over SSE (graphql-sse "distinct connections" mode).
+
+    Lets Waitress deployments, which have no websockets, use chatStream:
+    each event is sent as ``event: next`` and the end as ``event: complete``.
+    """
+    data = request.get_json()
+    loop = asyncio.new_event_loop()
+    context = {"request": request, "blocking": True}
+    success, result = loop.run_until_complete(subscribe(schema, data, context_value=context))
+    if not success:
+        loop.close()
+        return jsonify({"errors": result}), 400
+
+    def generate():
+        try:
+            while True:
+                try:
+                    event = loop.run_until_complete(result.__anext__())
+                except StopAsyncIteration:
+                    break
+                payload = {"data": event.data}
+                if event.errors:
+                    payload["errors"] = [format_error(e) for e in event.errors]
+                yield f"event: next\ndata: {json.dumps(payload)}\n\n"
+            yield "event: complete\ndata: \n\n"
+        finally:
+            loop.run_until_complete(result.aclose())
+            loop.close()
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream")
+
 @my_app.route("/stream-chat", methods=["POST"])
 def stream_chat():
     data = request.get_json()
-    username = data["username"]
-    user_input = data["message"]
 
-    user = User.query.filter_by(username=username).first()
-    if not user:
+    # Authorization: Bearer <login token>, or the legacy username field
+    user_id = chat_service.user_id(data.get("username"), bearer_token(request) or data.get("token"))
+    turn = chat_service.start(user_id, data["message"], data.get("documentId"))
+    if turn is None:
         def error_gen():
-            yield "data: Invalid user\n\n"
+            yield f"data: {INVALID_USER_MESSAGE}\n\n"
         return Response(error_gen(), mimetype="text/event-stream")
 
-    history = ChatHistory.query.filter_by(user_id=user.id).order_by(ChatHistory.id.desc()).limit(2).all()
-    messages = [{"role": "system", "content": "You are Tintu 🧸, a helpful bot."}]
-    messages += [{"role": h.role, "content": h.content} for h in reversed(history)]
-    messages.append({"role": "user", "content": user_input})
+    # Take an Ollama slot up front so an overloaded server fails fast
+    try:
+        tokens = turn.stream()
+    except LLMBusyError as e:
+        message = str(e)  # e is unbound once the except block ends
+        def busy_gen():
+            yield f"data: Error: {message}\n\n"
+        return Response(busy_gen(), status=503, mimetype="text/event-stream",
+                        headers={"Retry-After": "5"})
+    except Exception as e:
+        message = str(e)
+        def failed_gen():
+            yield f"data: Error: {message}\n\n"
+        return Response(failed_gen(), mimetype="text/event-stream")
 
     def generate():
         try:
-            stream = ollama.chat(
-                model=MODEL_NAME,
-                messages=messages,
-                stream=True,
-                options={
-                    "num_predict": 200,
-                    "temperature": 0.7
-                }
-            )
-
-            full_reply = ""
-            for chunk in stream:
-                token = chunk['message']['content']
-                full_reply += token
-                # Stream each chunk in SSE format
+            # Stream each chunk in SSE format; the turn is saved after the last one
+            for token in tokens:
                 yield f"data: {json.dumps({'token': token})}\n\n"
-
-            # Save both after the full stream is done
-            db.session.add(ChatHistory(user_id=user.id, role="user", content=user_input))
-            db.session.add(ChatHistory(user_id=user.id, role="assistant", content=full_reply))
-            db.session.commit()
-
         except Exception as e:
             yield f"data: Error: {str(e)}\n\n"
+        finally:
+            tokens.close()
 
     return Response(stream_with_context(generate()), mimetype="text/event-stream")
 
+@my_app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 # ✅ NEW: Serve stylized images from /uploads/
 @my_app.route("/uploads/<path:filename>")
 def uploaded_file(filename):
@@ -8,7 +8,16 @@ class User(db.Model):
     password_hash = db.Column(db.String(120), nullable=False)
 
 class ChatHistory(db.Model):
+    # Serves both "last N turns" (user_id, id DESC) and paging (user_id, id > cursor)
+    __table_args__ = (db.Index("ix_chat_history_user_id_id", "user_id", "id"),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     role = db.Column(db.String(10), nullable=False)  # 'user' or 'assistant'
     content = db.Column(db.Text, nullable=False)
+
+class ChatSummary(db.Model):
+    # Rolling summary of a user's turns up to and including last_message_id
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    content = db.Column(db.Text, nullable=False, default="")
+    last_message_id = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,100 @@
+# observability.py
+#
+# Request-level instrumentation: a latency histogram per REST route (the
+# GraphQL operations are timed in graphql_exec), observed once the response
+# body has been sent so streamed chat and PDF pages count in full, and an
+# optional trace id per request. The trace id is taken from X-Request-ID or generated, put in
+# a context variable so it follows the request into log records (threads
+# and asyncio alike), and echoed back in the response.
+
+import logging
+import os
+import time
+import uuid
+from contextvars import ContextVar
+
+from flask import g, request
+
+from app.metrics import Counter, Histogram
+
+TRACE_IDS = os.environ.get("TRACE_IDS", "0") == "1"
+TRACE_HEADER = "X-Request-ID"
+
+trace_id_var = ContextVar("trace_id", default="-")
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response body was fully sent (streamed bodies included)",
+    ["method", "route", "status"])
+http_errors = Counter(
+    "http_errors_total", "Responses with a 5xx status", ["route"])
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record):
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+def install_log_trace_ids():
+    """Add ``[trace_id]`` to every record handled by the root logger's handlers."""
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(level=logging.INFO)
+    for handler in root.handlers:
+        handler.addFilter(TraceIdFilter())
+        fmt = handler.formatter._fmt if handler.formatter else logging.BASIC_FORMAT
+        if "%(trace_id)s" not in fmt:
+            handler.setFormatter(logging.Formatter(fmt.replace("%(message)s", "[%(trace_id)s] %(message)s")))
+
+
+def new_trace_id(incoming=None):
+    # Accept a caller's id if it looks sane, so traces line up across services
+    if incoming and len(incoming) <= 64 and incoming.replace("-", "").isalnum():
+        return incoming
+    return uuid.uuid4().hex
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    if TRACE_IDS:
+        g.trace_id = new_trace_id(request.headers.get(TRACE_HEADER))
+        g.trace_token = trace_id_var.set(g.trace_id)
+
+
+def _finish_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # The rule, not the path, so /uploads/<path> etc. stay one series each
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        method, status = request.method, response.status_code
+
+        def observe():
+            http_request_seconds.observe(time.perf_counter() - started, method=method, route=route, status=status)
+            if status >= 500:
+                http_errors.inc(route=route)
+
+        # after_request runs before a streamed body is generated; the server
+        # closes the response only after the last chunk
+        response.call_on_close(observe)
+    if TRACE_IDS and "trace_id" in g:
+        response.headers[TRACE_HEADER] = g.trace_id
+    return response
+
+
+def _teardown_request(_exc):
+    token = g.pop("trace_token", None)
+    if token is not None:
+        try:
+            trace_id_var.reset(token)
+        except ValueError:
+            # Torn down from another context (e.g. after a streamed body)
+            trace_id_var.set("-")
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+    if TRACE_IDS:
+        install_log_trace_ids()
@@ -0,0 +1,89 @@
+# passwords.py
+#
+# bcrypt hashing off the request threads. Hashes run on a small dedicated
+# thread pool (bcrypt releases the GIL while it works), and only a bounded
+# number may be queued. The caller's request thread waits for its hash, so
+# the limit stays below the Waitress thread count: a login storm gets fast
+# "busy" answers while the reserved threads keep serving chat.
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from app.constants import WAITRESS_THREADS
+from app.metrics import Counter, Gauge, Histogram
+
+# Cost factor for new hashes; stored hashes with another cost are rehashed on login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", min(4, os.cpu_count() or 1)))
+# Request threads that bcrypt may never tie up
+PASSWORD_RESERVED_THREADS = int(os.environ.get("PASSWORD_RESERVED_THREADS", max(1, WAITRESS_THREADS // 2)))
+# Hashes allowed to wait or run at once before new ones are refused
+PASSWORD_QUEUE_LIMIT = int(os.environ.get(
+    "PASSWORD_QUEUE_LIMIT", max(1, WAITRESS_THREADS - PASSWORD_RESERVED_THREADS)
+))
+
+password_queue_depth = Gauge(
+    "password_hash_queue_depth", "bcrypt operations queued or running")
+password_queue_wait = Histogram(
+    "password_hash_queue_wait_seconds", "Time a bcrypt operation waited for a worker", ["op"])
+password_hash_seconds = Histogram(
+    "password_hash_seconds", "Time spent in bcrypt", ["op"])
+password_rejections = Counter(
+    "password_hash_rejections_total", "bcrypt operations refused because the queue was full", ["op"])
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def hash_rounds(password_hash):
+    # "$2b$12$<salt+hash>" -> 12
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=PASSWORD_WORKERS, queue_limit=PASSWORD_QUEUE_LIMIT):
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(queue_limit)
+
+    def _run(self, op, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            password_rejections.inc(op=op)
+            raise PasswordHasherBusy("Server busy, please try again in a moment.")
+        password_queue_depth.inc()
+        queued_at = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            password_queue_wait.observe(started - queued_at, op=op)
+            try:
+                return fn(*args)
+            finally:
+                password_hash_seconds.observe(time.perf_counter() - started, op=op)
+
+        try:
+            return self._executor.submit(job).result()
+        finally:
+            password_queue_depth.dec()
+            self._slots.release()
+
+    def hash(self, password):
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._run("hash", bcrypt.hashpw, password.encode(), salt).decode()
+
+    def verify(self, password, password_hash):
+        return self._run("verify", bcrypt.checkpw, password.encode(), password_hash.encode())
+
+    def needs_rehash(self, password_hash):
+        return hash_rounds(password_hash) != self.rounds
+
+
+password_hasher = PasswordHasher()
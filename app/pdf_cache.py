@@ -0,0 +1,94 @@
+# pdf_cache.py
+#
+# Persistent cache of extracted PDF text keyed by the SHA-256 of the file.
+# Pages are stored as one zlib-compressed JSON list per document in a small
+# SQLite file, so repeat uploads are answered without opening the PDF.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from app.metrics import Counter
+
+PDF_CACHE_ENABLED = os.environ.get("PDF_CACHE_ENABLED", "1") == "1"
+PDF_CACHE_PATH = os.environ.get("PDF_CACHE_PATH", "pdf_cache.db")
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MB", 256)) * 1024 * 1024
+# Documents whose extracted text is bigger than this are not cached
+PDF_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("PDF_CACHE_MAX_ENTRY_MB", 32)) * 1024 * 1024
+
+pdf_cache_events = Counter(
+    "pdf_cache_events_total", "PDF extraction cache lookups by result", ["result"])
+
+
+class PDFTextCache:
+    def __init__(self, path=PDF_CACHE_PATH, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._initialized:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS pdf_text ("
+                    " sha256 TEXT PRIMARY KEY,"
+                    " pages BLOB NOT NULL,"
+                    " size INTEGER NOT NULL,"
+                    " last_access REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_pdf_text_last_access ON pdf_text (last_access)")
+                conn.commit()
+                self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def get(self, sha256):
+        """List of page texts for a document hash, or None on a miss."""
+        conn = self._conn()
+        row = conn.execute("SELECT pages FROM pdf_text WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is None:
+            pdf_cache_events.inc(result="miss")
+            return None
+        pdf_cache_events.inc(result="hit")
+        conn.execute("UPDATE pdf_text SET last_access = ? WHERE sha256 = ?", (time.time(), sha256))
+        conn.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, sha256, texts):
+        blob = zlib.compress(json.dumps(texts, ensure_ascii=False).encode(), 6)
+        if len(blob) > PDF_CACHE_MAX_ENTRY_BYTES:
+            return False
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO pdf_text (sha256, pages, size, last_access) VALUES (?, ?, ?, ?)",
+                (sha256, blob, len(blob), time.time()),
+            )
+            self._evict(conn)
+            conn.commit()
+        return True
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pdf_text").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for sha256, size in conn.execute(
+            "SELECT sha256, size FROM pdf_text ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM pdf_text WHERE sha256 = ?", (sha256,))
+            total -= size
+            pdf_cache_events.inc(result="evicted")
+
+
+pdf_cache = PDFTextCache()
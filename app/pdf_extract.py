@@ -0,0 +1,198 @@
+# pdf_extract.py
+
+import hashlib
+import mmap
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from app.metrics import Counter, Histogram
+from app.pdf_cache import PDF_CACHE_ENABLED, pdf_cache
+
+# Streaming extraction keeps one page in memory at a time, so it can take
+# much larger files than the buffered endpoints
+MAX_STREAM_PDF_SIZE = int(os.environ.get("MAX_STREAM_PDF_MB", 200)) * 1024 * 1024
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Documents with at least this many pages are split across worker processes
+PARALLEL_PAGE_THRESHOLD = int(os.environ.get("PDF_PARALLEL_PAGE_THRESHOLD", 50))
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", min(4, os.cpu_count() or 1)))
+
+
+pdf_extract_seconds = Histogram(
+    "pdf_extract_seconds", "Whole-document text extraction time", ["mode"])
+pdf_pages_extracted = Counter(
+    "pdf_pages_extracted_total", "Pages run through text extraction", ["mode"])
+
+
+class PDFTooLarge(Exception):
+    pass
+
+
+class InvalidPDF(Exception):
+    pass
+
+
+def spool_upload(file, max_size=MAX_STREAM_PDF_SIZE):
+    """Copy an uploaded file to a temp .pdf in chunks; returns (path, size, sha256).
+
+    The caller owns the file and must remove it.
+    """
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            file.seek(0)
+            while True:
+                chunk = file.read(SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise PDFTooLarge(f"File too large. Max {max_size // (1024 * 1024)} MB allowed.")
+                digest.update(chunk)
+                out.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, size, digest.hexdigest()
+
+
+def hash_file(path, max_size=MAX_STREAM_PDF_SIZE):
+    """(size, sha256) of a file on disk, hashed through a read-only mmap."""
+    size = os.path.getsize(path)
+    if size > max_size:
+        raise PDFTooLarge(f"File too large. Max {max_size // (1024 * 1024)} MB allowed.")
+    if size == 0:
+        return 0, hashlib.sha256().hexdigest()
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        return size, hashlib.sha256(view).hexdigest()
+
+
+def page_record(number, text):
+    text = text.strip()
+    return {"page": number, "content": text, "preview": text[:100]}
+
+
+def iter_pages(doc):
+    """Yield one page record at a time from an open fitz document."""
+    for i, page in enumerate(doc, start=1):
+        yield page_record(i, page.get_text())
+
+
+def open_pdf(source):
+    """Open a PDF from a path or bytes, raising InvalidPDF if it can't be parsed."""
+    try:
+        if isinstance(source, str):
+            return fitz.open(source, filetype="pdf")
+        return fitz.open(stream=source, filetype="pdf")
+    except Exception as e:
+        raise InvalidPDF(str(e)) from e
+
+
+def cached_pages(sha256):
+    """Page records from the extraction cache, or None on a miss."""
+    if not PDF_CACHE_ENABLED:
+        return None
+    texts = pdf_cache.get(sha256)
+    if texts is None:
+        return None
+    return [page_record(i, text) for i, text in enumerate(texts, start=1)]
+
+
+def cache_pages(sha256, pages):
+    if PDF_CACHE_ENABLED:
+        pdf_cache.put(sha256, [p["content"] for p in pages])
+
+
+def extract_document(source):
+    """(sha256, page records) for a PDF path or bytes, served from the cache when possible.
+
+    The hash doubles as the document id for the retrieval index. Pass a path
+    where possible: the file is hashed and parsed without being read into
+    memory, and worker processes reopen it instead of receiving a copy.
+    """
+    if isinstance(source, str):
+        _, sha256 = hash_file(source)
+    else:
+        sha256 = hashlib.sha256(source).hexdigest()
+    pages = cached_pages(sha256)
+    if pages is not None:
+        return sha256, pages
+
+    doc = open_pdf(source)
+    try:
+        pages = extract_pages(doc, source)
+    finally:
+        doc.close()
+    cache_pages(sha256, pages)
+    return sha256, pages
+
+
+def remove_spooled(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _extract_range(source, start, stop):
+    # Runs in a worker process: reopen the document and extract [start, stop)
+    doc = fitz.open(source, filetype="pdf") if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+    try:
+        return [(i + 1, doc[i].get_text()) for i in range(start, stop)]
+    finally:
+        doc.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Workers import only this module (PyMuPDF, no torch or Flask), plus
+            # the entry script, which must keep app setup under its __main__ guard
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def page_ranges(page_count, shards):
+    size = -(-page_count // shards)
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def extract_pages(doc, source, workers=PDF_WORKERS, threshold=PARALLEL_PAGE_THRESHOLD):
+    """Page records for an open document, sharded over processes when it is large.
+
+    ``source`` is the path (preferred) or bytes the document was opened from,
+    so each worker can reopen it. Results are returned in page order.
+    """
+    page_count = doc.page_count
+    started = time.perf_counter()
+    if workers <= 1 or page_count < threshold:
+        mode = "inline"
+        pages = list(iter_pages(doc))
+    else:
+        mode = "pool"
+        # A few shards per worker evens out pages that are much slower than others
+        futures = [
+            _get_pool().submit(_extract_range, source, start, stop)
+            for start, stop in page_ranges(page_count, workers * 2)
+        ]
+        pages = []
+        for future in futures:
+            pages.extend(page_record(number, text) for number, text in future.result())
+    pdf_extract_seconds.observe(time.perf_counter() - started, mode=mode)
+    pdf_pages_extracted.inc(len(pages), mode=mode)
+    return pages
@@ -0,0 +1,156 @@
+# pdf_service.py
+#
+# PDF extraction shared by the REST blueprint and the GraphQL resolver:
+# validation, cached/sharded extraction, and queuing the document for the
+# retrieval index. Callers only translate results and PDFUploadError into
+# their own response format.
+
+import logging
+import os
+
+from app.doc_index import document_store
+from app.pdf_cache import PDF_CACHE_MAX_ENTRY_BYTES
+from app.pdf_extract import (
+    MAX_STREAM_PDF_SIZE, InvalidPDF, PDFTooLarge, cache_pages, cached_pages, extract_document,
+    hash_file, iter_pages, open_pdf, pdf_pages_extracted, remove_spooled, spool_upload
+)
+from app.uploads import upload_path
+
+logger = logging.getLogger(__name__)
+
+MAX_PDF_SIZE = 5 * 1024 * 1024  # 5 MB for the buffered (non-streaming) endpoints
+
+
+class PDFUploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _check_filename(file):
+    if not file or file.filename == '':
+        raise PDFUploadError("No selected file")
+    if not file.filename.lower().endswith('.pdf'):
+        raise PDFUploadError("Only PDF files are allowed")
+
+
+def extract_upload(file, max_size=MAX_PDF_SIZE):
+    """Extract an uploaded PDF; returns {"filename", "document_id", "pages"}.
+
+    Raises PDFUploadError for anything the client should be told about.
+    """
+    _check_filename(file)
+
+    file.seek(0, os.SEEK_END)
+    file_size = file.tell()
+    file.seek(0)
+    logger.info(f"Received file: {file.filename}, Size: {file_size} bytes")
+    if file_size > max_size:
+        raise PDFUploadError(f"File too large. Max {max_size // 1024} KB allowed.")
+
+    # Cached by content hash; large documents are split across worker processes.
+    # Work from the spooled upload on disk rather than a bytes copy of it.
+    path = upload_path(file)
+    spooled = None
+    if path is None:
+        spooled, _, _ = spool_upload(file, max_size)
+    try:
+        document_id, pages = extract_document(path or spooled)
+    except InvalidPDF as e:
+        logger.error(f"Failed to open PDF: {e}")
+        raise PDFUploadError("Invalid or corrupt PDF file")
+    finally:
+        if spooled:
+            remove_spooled(spooled)
+
+    total_chars = sum(len(p['content']) for p in pages)
+    logger.info(f"Extracted {len(pages)} pages, total {total_chars} characters")
+    if total_chars == 0:
+        raise PDFUploadError("No extractable text found in PDF")
+
+    # Chunk + embed in the background so the document can be chatted with
+    document_store.index_async(document_id, pages)
+    return {"filename": file.filename, "document_id": document_id, "pages": pages}
+
+
+class PDFPageStream:
+    """Page-by-page extraction of a spooled upload, replayed from the cache when possible.
+
+    ``events()`` yields start/page/end/error dicts; ``close()`` releases the
+    document and temp file and is safe to call more than once.
+    """
+
+    def __init__(self, file, max_size=MAX_STREAM_PDF_SIZE):
+        _check_filename(file)
+        # PyMuPDF reads pages from a file on disk, not from RAM. Uploads are
+        # normally spooled there already; otherwise copy to a temp file we own.
+        try:
+            self.path = upload_path(file)
+            self._owned = self.path is None
+            if self._owned:
+                self.path, file_size, self.sha256 = spool_upload(file, max_size)
+            else:
+                file_size, self.sha256 = hash_file(self.path, max_size)
+        except PDFTooLarge as e:
+            raise PDFUploadError(str(e), status=413)
+        logger.info(f"Spooled file for streaming: {file.filename}, Size: {file_size} bytes")
+
+        self.filename = file.filename
+        self.doc = None
+        self._closed = False
+        # Seen this exact file before? Replay its pages without opening it
+        self.pages = cached_pages(self.sha256)
+        if self.pages is not None:
+            self._remove()
+            return
+        try:
+            self.doc = open_pdf(self.path)
+        except InvalidPDF as e:
+            self._remove()
+            logger.error(f"Failed to open PDF: {e}")
+            raise PDFUploadError("Invalid or corrupt PDF file")
+
+    def _remove(self):
+        # Uploads spooled by the request are deleted with the request
+        if self._owned:
+            remove_spooled(self.path)
+
+    def close(self):
+        if not self._closed and self.doc is not None:
+            self._closed = True
+            self.doc.close()
+            self._remove()
+
+    def events(self):
+        doc = self.doc
+        total_chars = 0
+        page_count = len(self.pages) if doc is None else doc.page_count
+        # Collected for the cache only while it stays under the per-entry cap
+        extracted = [] if doc is not None else None
+        try:
+            yield {"type": "start", "filename": self.filename, "page_count": page_count}
+            for page in (self.pages if doc is None else iter_pages(doc)):
+                total_chars += len(page["content"])
+                if extracted is not None:
+                    extracted.append(page)
+                    if total_chars > PDF_CACHE_MAX_ENTRY_BYTES:
+                        extracted = None
+                yield dict(page, type="page")
+            logger.info(f"Streamed {page_count} pages, total {total_chars} characters")
+            if doc is not None:
+                pdf_pages_extracted.inc(page_count, mode="stream")
+            # Only documents whose text we still hold can be indexed for chat
+            indexed = self.pages if doc is None else extracted
+            document_id = self.sha256 if indexed is not None and total_chars > 0 else None
+            yield {"type": "end", "success": total_chars > 0, "page_count": page_count,
+                   "total_chars": total_chars, "document_id": document_id}
+            if extracted is not None:
+                cache_pages(self.sha256, extracted)
+            if document_id:
+                document_store.index_async(document_id, indexed)
+        except Exception as e:
+            logger.error(f"PDF extraction failed mid-stream: {e}")
+            yield {"type": "error", "message": "Failed to extract PDF text"}
+        finally:
+            self.close()
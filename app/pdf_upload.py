@@ -1,7 +1,8 @@
-from flask import Blueprint, request, jsonify
-import fitz  # PyMuPDF
-import os
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+import json
 import logging
+from app.pdf_extract import MAX_STREAM_PDF_SIZE
+from app.pdf_service import MAX_PDF_SIZE, PDFPageStream, PDFUploadError, extract_upload
 
 # 🔧 Logger Setup
 logging.basicConfig(
@@ -13,60 +14,79 @@ logger = logging.getLogger(__name__)
 # 🧩 Blueprint Setup
 pdf_bp = Blueprint('pdf_bp', __name__)
 
+# Room for the multipart boundary and headers around the file itself
+FORM_OVERHEAD = 64 * 1024
+
+
+def body_too_large(max_size):
+    """413 response if Content-Length already rules the file out, else None.
+
+    Must run before the first access to request.files, which reads and
+    spools the whole body.
+    """
+    if request.content_length and request.content_length > max_size + FORM_OVERHEAD:
+        if max_size >= 1024 * 1024:
+            limit = f"{max_size // (1024 * 1024)} MB"
+        else:
+            limit = f"{max_size // 1024} KB"
+        return jsonify({"success": False, "message": f"File too large. Max {limit} allowed."}), 413
+    return None
+
+
 @pdf_bp.route("/upload-pdf", methods=["POST"])
 def extractPDFText():
+    too_large = body_too_large(MAX_PDF_SIZE)
+    if too_large:
+        return too_large
+
     # 🔍 Validate file presence
     if 'file' not in request.files:
         return jsonify({"success": False, "message": "No file part"}), 400
 
-    file = request.files['file']
-
-    if file.filename == '':
-        return jsonify({"success": False, "message": "No selected file"}), 400
+    # 📖 Validate, extract and index (shared with the GraphQL resolver)
+    try:
+        result = extract_upload(request.files['file'])
+    except PDFUploadError as e:
+        return jsonify({"success": False, "message": e.message}), e.status
 
-    if not file.filename.lower().endswith('.pdf'):
-        return jsonify({"success": False, "message": "Only PDF files are allowed"}), 400
+    # ✅ Final structured response
+    return jsonify({
+        "success": True,
+        "filename": result["filename"],
+        "document_id": result["document_id"],
+        "page_count": len(result["pages"]),
+        "pages": result["pages"]
+    })
 
-    # 📏 File size check
-    file.seek(0, os.SEEK_END)
-    file_size = file.tell()
-    file.seek(0)
 
-    MAX_SIZE = 5 * 1024 * 1024  # 5 MB
-    logger.info(f"Received file: {file.filename}, Size: {file_size} bytes")
+@pdf_bp.route("/upload-pdf/stream", methods=["POST"])
+def streamPDFText():
+    """Emit pages as they are extracted, as NDJSON (default) or SSE (?format=sse)."""
+    too_large = body_too_large(MAX_STREAM_PDF_SIZE)
+    if too_large:
+        return too_large
 
-    if file_size > MAX_SIZE:
-        return jsonify({"success": False, "message": f"File too large. Max {MAX_SIZE // 1024} KB allowed."}), 400
+    if 'file' not in request.files:
+        return jsonify({"success": False, "message": "No file part"}), 400
 
-    # 📖 Open and extract PDF content
     try:
-        pdf_bytes = file.read()
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    except Exception as e:
-        logger.error(f"Failed to open PDF: {e}")
-        return jsonify({"success": False, "message": "Invalid or corrupt PDF file"}), 400
+        pages = PDFPageStream(request.files['file'])
+    except PDFUploadError as e:
+        return jsonify({"success": False, "message": e.message}), e.status
 
-    pages = []
-    for i, page in enumerate(doc, start=1):
-        page_text = page.get_text().strip()
-        pages.append({
-            "page": i,
-            "content": page_text,
-            "preview": page_text[:100]  # Optional preview field
-        })
+    sse = request.args.get("format") == "sse"
 
-    doc.close()
+    def emit(event):
+        if sse:
+            return f"data: {json.dumps(event)}\n\n"
+        return json.dumps(event) + "\n"
 
-    total_chars = sum(len(p['content']) for p in pages)
-    logger.info(f"Extracted {len(pages)} pages, total {total_chars} characters")
+    def generate():
+        for event in pages.events():
+            yield emit(event)
 
-    if total_chars == 0:
-        return jsonify({"success": False, "message": "No extractable text found in PDF"}), 400
-
-    # ✅ Final structured response
-    return jsonify({
-        "success": True,
-        "filename": file.filename,
-        "page_count": len(pages),
-        "pages": pages
-    })
\ No newline at end of file
+    mimetype = "text/event-stream" if sse else "application/x-ndjson"
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    # Also clean up if the client goes away before the first page is sent
+    response.call_on_close(pages.close)
+    return response
@@ -0,0 +1,56 @@
+# rate_limit.py
+#
+# In-memory token buckets keyed by arbitrary strings (a username, an IP).
+# Checked before any bcrypt work, so rejected attempts cost a dict lookup.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.metrics import Counter
+
+# Login attempts: a burst of N, refilled at N per minute
+LOGIN_USER_BURST = int(os.environ.get("LOGIN_USER_BURST", 5))
+LOGIN_IP_BURST = int(os.environ.get("LOGIN_IP_BURST", 20))
+RATE_LIMIT_KEYS = 100000
+
+rate_limited = Counter(
+    "rate_limited_total", "Requests refused by a rate limiter", ["limiter"])
+
+
+class RateLimiter:
+    def __init__(self, name, burst, per_seconds=60.0, max_keys=RATE_LIMIT_KEYS, clock=time.monotonic):
+        self.name = name
+        self.burst = burst
+        self.rate = burst / per_seconds
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Take one token for ``key``; False when its bucket is empty."""
+        if key is None or self.burst <= 0:
+            return True
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        if not allowed:
+            rate_limited.inc(limiter=self.name)
+        return allowed
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+login_user_limiter = RateLimiter("login_user", LOGIN_USER_BURST)
+login_ip_limiter = RateLimiter("login_ip", LOGIN_IP_BURST)
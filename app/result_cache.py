@@ -0,0 +1,132 @@
+# result_cache.py
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from app.metrics import Counter
+
+UPLOAD_DIR = "./uploads"
+RESULT_DIR = os.path.join(UPLOAD_DIR, "stylized")
+MAX_CACHE_BYTES = int(os.environ.get("STYLE_RESULT_CACHE_MB", 512)) * 1024 * 1024
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+style_result_cache_events = Counter(
+    "style_result_cache_total", "Stylized result cache lookups by result", ["result"])
+
+
+def result_key(image, style, settings, chunk_size=1024 * 1024):
+    """Hash of the input image plus everything that changes the output.
+
+    ``image`` is either bytes or a readable file object, which is hashed in
+    chunks and rewound afterwards.
+    """
+    if isinstance(image, (bytes, bytearray)):
+        digest = hashlib.sha256(image)
+    else:
+        digest = hashlib.sha256()
+        image.seek(0)
+        for chunk in iter(lambda: image.read(chunk_size), b""):
+            digest.update(chunk)
+        image.seek(0)
+    digest.update(b"\0" + style.encode())
+    digest.update(b"\0" + json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class StylizedResultStore:
+    """Size-bounded, content-addressed store of stylized images.
+
+    Files are named after their result key, so identical uploads map to the
+    same output regardless of filename. Hits bump the file's mtime and the
+    least recently used files are deleted once the store exceeds max_bytes.
+    """
+
+    def __init__(self, directory=RESULT_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes = None  # filename -> bytes, loaded lazily
+
+    def _index(self):
+        if self._sizes is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._sizes = {}
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and ".tmp-" not in entry.name:
+                    self._sizes[entry.name] = entry.stat().st_size
+        return self._sizes
+
+    def filename(self, key, style, source_filename):
+        ext = os.path.splitext(source_filename)[1].lower()
+        if ext not in IMAGE_EXTENSIONS:
+            ext = ".png"
+        return f"{style}_{key[:32]}{ext}"
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def url(self, filename):
+        rel = os.path.relpath(self.path(filename), UPLOAD_DIR).replace(os.sep, "/")
+        return f"/uploads/{rel}"
+
+    def lookup(self, filename):
+        """Return the URL of a cached result, or None on a miss."""
+        with self._lock:
+            if filename not in self._index():
+                style_result_cache_events.inc(result="miss")
+                return None
+            path = self.path(filename)
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                self._sizes.pop(filename, None)
+                style_result_cache_events.inc(result="miss")
+                return None
+        style_result_cache_events.inc(result="hit")
+        return self.url(filename)
+
+    def temp_path(self, filename):
+        # Keep the extension last so PIL still picks the right encoder
+        stem, ext = os.path.splitext(filename)
+        with self._lock:
+            self._index()
+        return self.path(f"{stem}.tmp-{uuid.uuid4().hex}{ext}")
+
+    def commit(self, temp_path, filename):
+        """Atomically publish a finished result and evict old entries."""
+        final_path = self.path(filename)
+        os.replace(temp_path, final_path)
+        with self._lock:
+            self._index()[filename] = os.path.getsize(final_path)
+            self._evict()
+        return self.url(filename)
+
+    def discard(self, temp_path):
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        total = sum(self._sizes.values())
+        if total <= self.max_bytes:
+            return
+        by_age = []
+        for name in self._sizes:
+            try:
+                by_age.append((os.path.getmtime(self.path(name)), name))
+            except FileNotFoundError:
+                by_age.append((0, name))
+        for _, name in sorted(by_age):
+            if total <= self.max_bytes:
+                break
+            total -= self._sizes.pop(name)
+            self.discard(self.path(name))
+
+
+result_store = StylizedResultStore()
@@ -1,27 +1,34 @@
 # schema.py
 import os
-import bcrypt
-import ollama
-import fitz  # PyMuPDF
+import uuid
 import torch
 from torchvision import transforms
 from PIL import Image
-from app.models import db, User, ChatHistory
-from app.style_transfer import run_style_transfer
+from app.models import db, User
+from app.auth import context_token, token_auth
+from app.graphql_exec import loaders_for
+from app.chat_service import INVALID_USER_MESSAGE, chat_service
+from app.llm_client import LLMBusyError
+from app.style_transfer import run_style_transfer, transfer_settings
+from app.result_cache import result_key, result_store
+from app.style_jobs import style_jobs, StyleJobQueueFull
+from app.passwords import PasswordHasherBusy, password_hasher
+from app.pdf_service import PDFUploadError, extract_upload
+from app.rate_limit import login_ip_limiter, login_user_limiter
+from app.uploads import keep_upload, upload_path
 from ariadne import (
     QueryType,
     MutationType,
     ScalarType,
+    SubscriptionType,
     make_executable_schema
 )
 
 # ========
 # Constants
 # ========
-MODEL_NAME = "my-chat"
-MAX_PDF_SIZE = 5 * 1024 * 1024  # 5MB
-
 UPLOAD_DIR = "./uploads"
+INCOMING_DIR = os.path.join(UPLOAD_DIR, "incoming")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # Load your CNN style models once for efficiency
@@ -42,14 +49,22 @@ type_defs = """
 
     type Query {
         getUser(username: String!): User
+        me(token: String): User
     }
 
     type Mutation {
         register(username: String!, password: String!): RegisterResponse!
         login(username: String!, password: String!): LoginResponse!
-        chat(username: String!, message: String!): ChatResponse!
+        logout(token: String): LogoutResponse!
+        chat(username: String, message: String!, documentId: String, token: String): ChatResponse!
         extractPDFText(file: Upload!): PDFExtractionResult!
-        styleTransfer(file: Upload!, style: String!): StyleTransferResult!
+        styleTransfer(
+            file: Upload!
+            style: String!
+            background: Boolean = false
+            preview: Boolean = false
+            tiled: Boolean = false
+        ): StyleTransferResult!
     }
 
     type User {
@@ -65,6 +80,12 @@ type_defs = """
     type LoginResponse {
         success: Boolean!
         message: String!
+        token: String
+    }
+
+    type LogoutResponse {
+        success: Boolean!
+        message: String!
     }
 
     type ChatResponse {
@@ -80,6 +101,8 @@ type_defs = """
     type PDFExtractionResult {
         success: Boolean!
         filename: String!
+        message: String
+        documentId: String
         page_count: Int!
         pages: [PDFPage!]!
     }
@@ -87,6 +110,15 @@ type_defs = """
     type StyleTransferResult {
         imageUrl: String!
         message: String
+        jobId: String
+        status: String
+    }
+
+    type StyleTransferJob {
+        id: String!
+        status: String!
+        imageUrl: String
+        message: String
     }
     type ChatMessage {
         id: Int!
@@ -94,8 +126,19 @@ type_defs = """
         content: String!
     }
 
+    type ChatStreamEvent {
+        token: String
+        done: Boolean!
+        error: String
+    }
+
+    type Subscription {
+        chatStream(username: String, message: String!, documentId: String, token: String): ChatStreamEvent!
+    }
+
     extend type Query {
-        getChatHistory(username: String!): [ChatMessage!]!
+        getChatHistory(username: String, first: Int, after: Int, token: String): [ChatMessage!]!
+        styleTransferJob(id: String!): StyleTransferJob
     }
 
 """
@@ -105,17 +148,39 @@ type_defs = """
 # ==========
 query = QueryType()
 mutation = MutationType()
+subscription = SubscriptionType()
 upload_scalar = ScalarType("Upload")
 
+def _caller_id(info, username=None, token=None):
+    # A token (argument or Authorization: Bearer) wins; username is the legacy fallback
+    return chat_service.user_id(username, token or context_token(info.context))
+
 @query.field("getUser")
 def resolve_get_user(_, info, username):
-    return User.query.filter_by(username=username).first()
+    # Batched with the operation's other user lookups
+    return loaders_for(info).user(username)
+
+@query.field("me")
+def resolve_me(_, info, token=None):
+    user_id = _caller_id(info, token=token)
+    return db.session.get(User, user_id) if user_id is not None else None
+
+LOGIN_FAILED = {"success": False, "message": "Login failed"}
+TOO_MANY_ATTEMPTS = {"success": False, "message": "Too many attempts, please try again later"}
+
+def _client_ip(info):
+    return getattr(info.context, "remote_addr", None)
 
 @mutation.field("register")
 def resolve_register(_, info, username, password):
+    if not login_ip_limiter.allow(_client_ip(info)):
+        return TOO_MANY_ATTEMPTS
     if User.query.filter_by(username=username).first():
         return {"success": False, "message": "Username exists"}
-    pw_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    try:
+        pw_hash = password_hasher.hash(password)
+    except PasswordHasherBusy as e:
+        return {"success": False, "message": str(e)}
     new_user = User(username=username, password_hash=pw_hash)
     db.session.add(new_user)
     db.session.commit()
@@ -123,128 +188,183 @@ def resolve_register(_, info, username, password):
 
 @mutation.field("login")
 def resolve_login(_, info, username, password):
+    # Refuse storms before spending any bcrypt time on them
+    if not login_ip_limiter.allow(_client_ip(info)) or not login_user_limiter.allow(username):
+        return TOO_MANY_ATTEMPTS
     user = User.query.filter_by(username=username).first()
     if not user:
-        return {"success": False, "message": "Login failed"}
-    if bcrypt.checkpw(password.encode(), user.password_hash.encode()):
-        return {"success": True, "message": "Login successful"}
-    return {"success": False, "message": "Login failed"}
+        return LOGIN_FAILED
+    try:
+        if not password_hasher.verify(password, user.password_hash):
+            return LOGIN_FAILED
+    except PasswordHasherBusy as e:
+        return {"success": False, "message": str(e)}
+    login_user_limiter.reset(username)
+    token = token_auth.issue(user.id)
+
+    # Bring hashes made with an older BCRYPT_ROUNDS up to the current cost;
+    # if the pool is saturated, try again on a later login
+    if password_hasher.needs_rehash(user.password_hash):
+        try:
+            user.password_hash = password_hasher.hash(password)
+            db.session.commit()
+        except PasswordHasherBusy:
+            pass
+    return {"success": True, "message": "Login successful", "token": token}
+
+@mutation.field("logout")
+def resolve_logout(_, info, token=None):
+    if token_auth.revoke(token or context_token(info.context)):
+        return {"success": True, "message": "Logged out"}
+    return {"success": False, "message": "Invalid token"}
 
 @mutation.field("chat")
-def resolve_chat(_, info, username, message):
-    user = User.query.filter_by(username=username).first()
-    if not user:
-        return {"reply": "Invalid user"}
-
-    # Tight context: last 2 messages
-    history = ChatHistory.query.filter_by(user_id=user.id).order_by(ChatHistory.id.desc()).limit(2).all()
-    messages = [{"role": "system", "content": "You are Tintu 🧸, a helpful bot."}]
-    messages += [{"role": h.role, "content": h.content} for h in reversed(history)]
-    messages.append({"role": "user", "content": message})
+def resolve_chat(_, info, message, username=None, documentId=None, token=None):
+    turn = chat_service.start(_caller_id(info, username, token), message, documentId)
+    if turn is None:
+        return {"reply": INVALID_USER_MESSAGE}
 
     try:
-        stream = ollama.chat(
-            model=MODEL_NAME,
-            messages=messages,
-            stream=True,
-            options={
-                "num_predict": 200,
-                "temperature": 0.7
-            }
-        )
-
-        chunks = []
-        for chunk in stream:
-            chunks.append(chunk['message']['content'])
-        bot_reply = "".join(chunks)
-
-    except Exception as e:
-        print(f"Ollama stream error: {e}")
-        bot_reply = "Sorry, something went wrong while generating a reply."
-
-    db.session.add(ChatHistory(user_id=user.id, role="user", content=message))
-    db.session.add(ChatHistory(user_id=user.id, role="assistant", content=bot_reply))
-    db.session.commit()
-
-    return {"reply": bot_reply}
+        return {"reply": turn.reply()}
+    except LLMBusyError as e:
+        # Nothing was generated, so the turn isn't recorded
+        return {"reply": str(e)}
 
 @mutation.field("extractPDFText")
 def resolve_extract_pdf_text(_, info, file):
-    file_obj = file
-    filename = file_obj.filename
-
-    if not filename.lower().endswith(".pdf"):
-        return {"success": False, "filename": filename, "page_count": 0, "pages": []}
-
-    file_obj.seek(0, os.SEEK_END)
-    size = file_obj.tell()
-    file_obj.seek(0)
-
-    if size > MAX_PDF_SIZE:
-        return {"success": False, "filename": filename, "page_count": 0, "pages": []}
-
     try:
-        pdf_bytes = file_obj.read()
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    except Exception:
-        return {"success": False, "filename": filename, "page_count": 0, "pages": []}
-
-    pages = []
-    for i, page in enumerate(doc, start=1):
-        content = page.get_text().strip()
-        pages.append({
-            "page": i,
-            "content": content,
-            "preview": content[:100]
-        })
-    doc.close()
+        result = extract_upload(file)
+    except PDFUploadError as e:
+        return {"success": False, "filename": file.filename, "message": e.message, "page_count": 0, "pages": []}
 
     return {
         "success": True,
-        "filename": filename,
-        "page_count": len(pages),
-        "pages": pages
+        "filename": result["filename"],
+        "documentId": result["document_id"],
+        "page_count": len(result["pages"]),
+        "pages": result["pages"]
     }
 
+# ==========
+# Chat Subscription
+# ==========
+@subscription.source("chatStream")
+async def chat_stream_source(_, info, message, username=None, documentId=None, token=None):
+    # Served over graphql-transport-ws by the ASGI app, and over SSE by Flask's
+    # /graphql/stream, which runs each subscription on its own short-lived loop
+    # inside the request thread; there the blocking client is used instead
+    blocking = isinstance(info.context, dict) and info.context.get("blocking")
+    token = token or context_token(info.context)
+    if blocking:
+        turn = chat_service.start(chat_service.user_id(username, token), message, documentId)
+    else:
+        turn = await chat_service.astart(message, documentId, username=username, token=token)
+    if turn is None:
+        yield {"token": None, "done": True, "error": INVALID_USER_MESSAGE}
+        return
+
+    try:
+        if blocking:
+            tokens = turn.stream()
+            try:
+                for token in tokens:
+                    yield {"token": token, "done": False}
+            finally:
+                tokens.close()
+        else:
+            async for token in turn.astream():
+                yield {"token": token, "done": False}
+    except Exception as e:
+        # Busy or a failed generation: end the stream with the error, as /stream-chat does
+        yield {"token": None, "done": True, "error": str(e)}
+        return
+    yield {"token": None, "done": True}
+
+@subscription.field("chatStream")
+def resolve_chat_stream(event, info, **kwargs):
+    return event
+
 # ==========
 # CNN Style Transfer Resolver
 # ==========
 @mutation.field("styleTransfer")
-def resolve_style_transfer(_, info, file, style):
+def resolve_style_transfer(_, info, file, style, background=False, preview=False, tiled=False):
     file_obj = file
     filename = file_obj.filename
 
-    # Save uploaded file
-    input_path = os.path.join(UPLOAD_DIR, filename)
-    file_obj.seek(0)
-    with open(input_path, "wb") as f:
-        f.write(file_obj.read())
-
-    # Output path
-    output_filename = f"stylized_{style}_{filename}"
-    output_path = os.path.join(UPLOAD_DIR, output_filename)
-
-    # Call reusable helper
+    # Same bytes + style + settings -> same output, whatever the filename
+    key = result_key(file_obj.stream, style, transfer_settings(style, preview, tiled))
+    output_filename = result_store.filename(key, style, filename)
+    cached_url = result_store.lookup(output_filename)
+    if cached_url:
+        return {"imageUrl": cached_url, "message": f"Your image is stylized with {style}!", "status": "done"}
+
+    output_path = result_store.temp_path(output_filename)
+    image_url = result_store.url(output_filename)
+
+    # Job mode: hand off to the process pool and return straight away
+    if background:
+        # The worker process needs the upload on disk; unique name so uploads can't clash
+        os.makedirs(INCOMING_DIR, exist_ok=True)
+        input_path = os.path.join(INCOMING_DIR, f"{uuid.uuid4().hex}{os.path.splitext(filename)[1]}")
+        keep_upload(file_obj, input_path)
+
+        def on_done(future):
+            _remove_quietly(input_path)
+            if future.exception() is None:
+                result_store.commit(output_path, output_filename)
+            else:
+                result_store.discard(output_path)
+
+        try:
+            job_id = style_jobs.submit(
+                input_path, output_path, image_url, style, on_done=on_done, preview=preview, tiled=tiled
+            )
+        except StyleJobQueueFull as e:
+            _remove_quietly(input_path)
+            return {"imageUrl": "", "message": str(e), "status": "busy"}
+        return {"imageUrl": "", "message": "Style transfer queued", "jobId": job_id, "status": "queued"}
+
+    # Call reusable helper, decoding straight from the spooled upload
     try:
-        run_style_transfer(input_path, output_path, style)
-        image_url = f"/uploads/{output_filename}"
+        run_style_transfer(upload_path(file_obj) or file_obj.stream, output_path, style, preview=preview, tiled=tiled)
+        image_url = result_store.commit(output_path, output_filename)
         message = f"Your image is stylized with {style}!"
+        status = "done"
     except Exception as e:
+        result_store.discard(output_path)
         image_url = ""
         message = f"Style transfer failed: {e}"
+        status = "failed"
 
-    return {"imageUrl": image_url, "message": message}
+    return {"imageUrl": image_url, "message": message, "status": status}
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+@query.field("styleTransferJob")
+def resolve_style_transfer_job(_, info, id):
+    return style_jobs.status(id)
 
 @query.field("getChatHistory")
-def resolve_get_chat_history(_, info, username):
-    user = User.query.filter_by(username=username).first()
-    if not user:
+def resolve_get_chat_history(_, info, username=None, first=None, after=None, token=None):
+    # `after` is the id of the last message the client already has
+    loaders = loaders_for(info)
+    token = token or context_token(info.context)
+    if token:
+        user_id = chat_service.user_id(token=token)
+    else:
+        user = loaders.user(username) if username else None
+        user_id = user.id if user else None
+    if user_id is None:
         return []
-    history = ChatHistory.query.filter_by(user_id=user.id).order_by(ChatHistory.id.asc()).all()
-    return [{"id": h.id, "role": h.role, "content": h.content} for h in history]
+    return loaders.history(user_id, first=first, after=after)
 
 
 # ==========
 # Schema
 # ==========
-schema = make_executable_schema(type_defs, [query, mutation, upload_scalar])
+schema = make_executable_schema(type_defs, [query, mutation, subscription, upload_scalar])
@@ -0,0 +1,104 @@
+# style_batcher.py
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+from app.style_transfer import style_models
+
+MAX_BATCH_SIZE = int(os.environ.get("STYLE_BATCH_SIZE", 8))
+MAX_WAIT_MS = float(os.environ.get("STYLE_BATCH_WAIT_MS", 20))
+
+
+class _Job:
+    __slots__ = ("style", "tensor", "size", "future")
+
+    def __init__(self, style, tensor):
+        self.style = style
+        self.tensor = tensor
+        self.size = tuple(tensor.shape[-2:])
+        self.future = Future()
+
+
+class StyleTransferBatcher:
+    """Collects pending style-transfer jobs into micro-batches.
+
+    A single worker thread owns the model calls, so concurrent requests no
+    longer fight over the torch thread pool. Only jobs for the same style
+    and the exact same shape are stacked: resizing or padding to a shared
+    shape would change every pixel (TransformerNet's instance norm sees the
+    whole image), so batched output matches the one-at-a-time path. Inputs
+    are already resized to a fixed short side, so photos with a common
+    aspect ratio still share batches.
+    """
+
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, style_name, tensor):
+        """Queue a CHW tensor for ``style_name``; returns a Future of CHW output."""
+        self._ensure_started()
+        job = _Job(style_name, tensor)
+        self._queue.put(job)
+        return job.future
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="style-batcher", daemon=True
+            )
+            self._thread.start()
+
+    def _collect(self):
+        jobs = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(jobs) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                jobs.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._collect()
+            groups = {}
+            for job in jobs:
+                key = (job.style, job.size)
+                groups.setdefault(key, []).append(job)
+
+            for (style, _), group in groups.items():
+                try:
+                    self._run_group(style, group)
+                except Exception as e:
+                    for job in group:
+                        if not job.future.done():
+                            job.future.set_exception(e)
+
+    def _run_group(self, style, group):
+        model = style_models.get(style)
+        batch = torch.stack([job.tensor for job in group])
+
+        with torch.no_grad():
+            output = model(batch).cpu()
+
+        for job, out in zip(group, output):
+            job.future.set_result(out)
+
+
+style_batcher = StyleTransferBatcher()
@@ -0,0 +1,150 @@
+# style_jobs.py
+
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from app.style_transfer import run_style_transfer
+
+MAX_WORKERS = int(os.environ.get("STYLE_JOB_WORKERS", 2))
+MAX_QUEUE_DEPTH = int(os.environ.get("STYLE_JOB_QUEUE_DEPTH", 16))
+TORCH_THREADS_PER_WORKER = int(os.environ.get("STYLE_JOB_TORCH_THREADS", 2))
+# Finished jobs are forgotten after this many seconds
+JOB_TTL = int(os.environ.get("STYLE_JOB_TTL", 3600))
+
+
+class StyleJobQueueFull(Exception):
+    pass
+
+
+_started = None  # worker side: queue of job ids that have begun running
+
+
+def _init_worker(num_threads, started):
+    global _started
+    import torch
+    torch.set_num_threads(num_threads)
+    _started = started
+
+
+def _run_job(job_id, *args, **options):
+    # future.running() is already true while a job waits in the pool's call
+    # queue, so the worker reports when it actually picks the job up
+    _started.put(job_id)
+    return run_style_transfer(*args, **options)
+
+
+class StyleJobManager:
+    """Runs style transfers on a bounded process pool and tracks their status.
+
+    Each job moves through queued -> running -> done/failed; a job is
+    running once a worker has picked it up. Submitting
+    while ``max_queue_depth`` jobs are still unfinished raises
+    StyleJobQueueFull so callers can answer "busy" instead of piling up work.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_queue_depth=MAX_QUEUE_DEPTH):
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self._executor = None
+        self._started = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn: forking a process that already started torch threads can deadlock.
+            # Workers import only this module and app.style_transfer, plus the
+            # entry script, which must keep app setup under its __main__ guard
+            context = multiprocessing.get_context("spawn")
+            self._started = context.SimpleQueue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(TORCH_THREADS_PER_WORKER, self._started),
+            )
+            threading.Thread(target=self._watch_started, args=(self._started,),
+                             name="style-job-started", daemon=True).start()
+        return self._executor
+
+    def _watch_started(self, started):
+        while True:
+            job_id = started.get()
+            if job_id is None:
+                return
+            with self._lock:
+                if job_id in self._jobs:
+                    self._jobs[job_id]["started"] = True
+
+    def pending(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job["future"].done())
+
+    def submit(self, input_path, output_path, image_url, style, on_done=None, **options):
+        with self._lock:
+            self._prune()
+            active = sum(1 for job in self._jobs.values() if not job["future"].done())
+            if active >= self.max_queue_depth:
+                raise StyleJobQueueFull(
+                    f"Server busy: {active} style transfer jobs queued, try again later"
+                )
+            job_id = uuid.uuid4().hex
+            future = self._pool().submit(_run_job, job_id, input_path, output_path, style, **options)
+            self._jobs[job_id] = {
+                "future": future,
+                "started": False,
+                "style": style,
+                "image_url": image_url,
+                "created": time.time(),
+                "finished": None,
+            }
+        future.add_done_callback(lambda f: self._mark_finished(job_id, f, on_done))
+        return job_id
+
+    def _mark_finished(self, job_id, future, on_done):
+        # Run the caller's hook first so "done" is only reported once it has finished
+        if on_done is not None:
+            try:
+                on_done(future)
+            except Exception:
+                pass
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id]["finished"] = time.time()
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL
+        for job_id in [k for k, job in self._jobs.items()
+                       if job["finished"] and job["finished"] < cutoff]:
+            del self._jobs[job_id]
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+
+        future = job["future"]
+        result = {"id": job_id, "status": "queued", "imageUrl": None, "message": None}
+        if job["finished"]:
+            error = future.exception()
+            if error is None:
+                result.update(status="done", imageUrl=job["image_url"],
+                              message=f"Your image is stylized with {job['style']}!")
+            else:
+                result.update(status="failed", message=f"Style transfer failed: {error}")
+        elif job["started"] or future.done():
+            result["status"] = "running"
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._started.put(None)
+
+
+style_jobs = StyleJobManager()
@@ -1,10 +1,15 @@
 # style_transfer.py
 
+import numpy as np
 import torch
 from torchvision import transforms
 from PIL import Image
 import os
+import threading
+from collections import OrderedDict
 from app.transformer_net import TransformerNet  # Or your model definition
+from app.inference_backend import INFERENCE_BACKEND, prepare_model
+from app.metrics import Histogram
 
 # Where your style models (.pth) live
 STYLE_MODELS = {
@@ -14,15 +19,32 @@ STYLE_MODELS = {
     # Add more style .pth files here!
 }
 
-def run_style_transfer(input_image_path, output_image_path, style_name):
-    if style_name not in STYLE_MODELS:
-        raise ValueError(f"Style '{style_name}' not found!")
+# How many loaded style models to keep in memory at once
+MAX_CACHED_STYLES = int(os.environ.get("STYLE_MODEL_CACHE_SIZE", 8))
 
-    # Load model for selected style
-    model_path = STYLE_MODELS[style_name]
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Model file not found: {model_path}")
+# Short side of the image fed to the network
+RESIZE_SHORT_SIDE = 512
+# Smaller resize used for fast thumbnail previews
+PREVIEW_SHORT_SIDE = int(os.environ.get("STYLE_PREVIEW_SIZE", 256))
 
+# Tiled full-resolution mode: peak activation memory budget and tile overlap
+TILE_MEMORY_BUDGET_MB = int(os.environ.get("STYLE_TILE_MEMORY_MB", 512))
+TILE_OVERLAP = int(os.environ.get("STYLE_TILE_OVERLAP", 32))
+# Rough peak activation bytes per input pixel for one TransformerNet forward
+BYTES_PER_PIXEL = 640
+# Tiles bound the network's memory, but the full-resolution input, output and
+# blend weights (~28 bytes per pixel) are not; cap the image size instead
+TILED_MAX_PIXELS = int(float(os.environ.get("STYLE_TILED_MAX_MEGAPIXELS", 24)) * 1_000_000)
+
+# Route inference through the micro-batching worker (see style_batcher.py)
+STYLE_BATCHING = os.environ.get("STYLE_BATCHING", "0") == "1"
+
+# Recorded in whichever process runs the transfer (background jobs: the pool workers)
+style_stage_seconds = Histogram(
+    "style_transfer_stage_seconds", "Style transfer time by stage", ["stage"])
+
+
+def load_style_model(model_path, backend=INFERENCE_BACKEND):
     model = TransformerNet()
     checkpoint = torch.load(model_path)
     # Remove incompatible keys
@@ -30,33 +52,240 @@ def run_style_transfer(input_image_path, output_image_path, style_name):
         k: v for k, v in checkpoint.items()
         if "running_mean" not in k and "running_var" not in k
     }
-    # # Check if it's a checkpoint dict or raw state dict
-    # if isinstance(checkpoint, dict) and 'state_dict' in checkpoint:
-    #     state_dict = checkpoint['state_dict']
-    # else:
-    #     state_dict = checkpoint
-
     model.load_state_dict(cleaned_state_dict)
     model.eval()
+    return prepare_model(model, backend)
+
+
+class StyleModelRegistry:
+    """Process-wide LRU cache of loaded TransformerNet models.
+
+    Models are keyed by style name and remember the mtime of the .pth file
+    they were loaded from, so replacing a file on disk picks up the new
+    weights on the next call (or immediately via ``reload``).
+    """
+
+    def __init__(self, style_models, max_size=MAX_CACHED_STYLES):
+        self.style_models = style_models
+        self.max_size = max(1, max_size)
+        self._models = OrderedDict()  # style -> (mtime, model)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def _model_path(self, style_name):
+        if style_name not in self.style_models:
+            raise ValueError(f"Style '{style_name}' not found!")
+        model_path = self.style_models[style_name]
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model file not found: {model_path}")
+        return model_path
+
+    def get(self, style_name):
+        model_path = self._model_path(style_name)
+        mtime = os.path.getmtime(model_path)
+
+        with self._lock:
+            cached = self._models.get(style_name)
+            if cached and cached[0] == mtime:
+                self._models.move_to_end(style_name)
+                return cached[1]
+            load_lock = self._load_locks.setdefault(style_name, threading.Lock())
+
+        # Only one thread loads a given style; others wait and reuse it
+        with load_lock:
+            with self._lock:
+                cached = self._models.get(style_name)
+                if cached and cached[0] == mtime:
+                    self._models.move_to_end(style_name)
+                    return cached[1]
+
+            model = load_style_model(model_path)
+
+            with self._lock:
+                self._models[style_name] = (mtime, model)
+                self._models.move_to_end(style_name)
+                while len(self._models) > self.max_size:
+                    self._models.popitem(last=False)
+            return model
+
+    def reload(self, style_name=None):
+        """Drop cached weights for one style (or all) and load them again."""
+        styles = [style_name] if style_name else list(self.style_models)
+        with self._lock:
+            for name in styles:
+                self._models.pop(name, None)
+        for name in styles:
+            self.get(name)
+
+    def version(self, style_name):
+        """Modification time and size of the style's .pth file, or None if it is missing."""
+        try:
+            stat = os.stat(self.style_models[style_name])
+        except (KeyError, FileNotFoundError):
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def warm(self):
+        """Preload as many styles as fit in the cache, skipping missing files."""
+        for name in list(self.style_models)[:self.max_size]:
+            try:
+                self.get(name)
+            except (ValueError, FileNotFoundError):
+                continue
+
+    def loaded_styles(self):
+        with self._lock:
+            return list(self._models)
+
+
+style_models = StyleModelRegistry(STYLE_MODELS)
+
+
+def decode_image(source, short_side=RESIZE_SHORT_SIDE, max_pixels=None):
+    """Open an image from a path or file object, decoding no more pixels than needed.
+
+    For JPEGs the decoder's draft mode scales by 1/2, 1/4 or 1/8 during
+    decode, so a 24MP photo headed for a 512px resize never materializes
+    at full size. Images over ``max_pixels`` are refused from their header,
+    before any decoding.
+    """
+    image = Image.open(source)
+    if max_pixels and image.width * image.height > max_pixels:
+        raise ValueError(
+            f"Image is {image.width}x{image.height}; tiled mode accepts at most "
+            f"{max_pixels / 1_000_000:g} megapixels"
+        )
+    if short_side and image.format == "JPEG":
+        width, height = image.size
+        scale = short_side / min(width, height)
+        if scale < 1:
+            image.draft("RGB", (int(width * scale), int(height * scale)))
+    return image.convert("RGB")
+
+
+def image_to_tensor(image):
+    # HWC uint8 -> CHW float32 in 0..255 with a single float allocation;
+    # the permuted view keeps NHWC strides, which the convs accept as-is
+    array = np.array(image, dtype=np.uint8)
+    return torch.from_numpy(array).permute(2, 0, 1).float()
 
 
+def preprocess_image(image, short_side=RESIZE_SHORT_SIDE):
+    if short_side:
+        image = transforms.Resize(short_side)(image)
+    return image_to_tensor(image)
+
+
+def postprocess_tensor(output):
+    output = output.clamp_(0, 255).to(torch.uint8).permute(1, 2, 0).contiguous()
+    return Image.fromarray(output.numpy())
+
+
+def stylize(style_name, tensor):
+    """Run a single CHW tensor through the style model, returning CHW."""
+    if STYLE_BATCHING:
+        from app.style_batcher import style_batcher
+        return style_batcher.submit(style_name, tensor).result()
+
+    model = style_models.get(style_name)
+    with torch.no_grad():
+        return model(tensor.unsqueeze(0)).cpu().squeeze(0)
+
+
+def tile_size_for_budget(budget_mb=TILE_MEMORY_BUDGET_MB):
+    """Largest square tile (multiple of 4) whose forward pass fits the budget."""
+    side = int((budget_mb * 1024 * 1024 / BYTES_PER_PIXEL) ** 0.5)
+    return max(64, side - side % 4)
+
+
+def _tile_starts(length, tile, overlap):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, tile - overlap))
+    starts.append(length - tile)
+    return starts
+
+
+def _blend_ramp(length, overlap):
+    # Linear fade over the overlap so neighbouring tiles cross-fade at seams
+    idx = torch.arange(length, dtype=torch.float32)
+    ramp = torch.minimum(idx + 1, length - idx) / (overlap + 1)
+    return ramp.clamp(max=1.0)
+
+
+def stylize_tiled(style_name, tensor, tile=None, overlap=TILE_OVERLAP):
+    """Stylize a CHW tensor of any size in overlapping tiles.
+
+    Peak network memory is bounded by the tile size rather than the image
+    size; overlapping regions are blended with linear weights to hide seams.
+    The full-size input, output and weight buffers still scale with the
+    image, which is why run_style_transfer caps it at TILED_MAX_PIXELS.
+    """
+    tile = tile or tile_size_for_budget()
+    overlap = min(overlap, tile // 4)
+    _, height, width = tensor.shape
+    if height <= tile and width <= tile:
+        return stylize(style_name, tensor)
+
+    model = style_models.get(style_name)
+    output = torch.zeros(3, height, width)
+    weights = torch.zeros(1, height, width)
+
+    for top in _tile_starts(height, tile, overlap):
+        for left in _tile_starts(width, tile, overlap):
+            patch = tensor[:, top:top + tile, left:left + tile]
+            h, w = patch.shape[-2:]
+            with torch.no_grad():
+                out = model(patch.unsqueeze(0)).squeeze(0)[:, :h, :w]
+            weight = _blend_ramp(h, overlap)[:, None] * _blend_ramp(w, overlap)[None, :]
+            output[:, top:top + h, left:left + w] += out * weight
+            weights[:, top:top + h, left:left + w] += weight
+
+    return output.div_(weights)
+
+
+def transfer_settings(style_name, preview=False, tiled=False):
+    """Everything besides the image and style name that changes the output.
+
+    Includes the model file's version and the inference backend, so
+    replaced weights or a backend switch don't serve stale results.
+    """
+    settings = {"model": style_models.version(style_name), "backend": INFERENCE_BACKEND}
+    if tiled:
+        settings.update(resize=None, tiled=True, tile=tile_size_for_budget(), overlap=TILE_OVERLAP)
+    else:
+        settings["resize"] = PREVIEW_SHORT_SIDE if preview else RESIZE_SHORT_SIDE
+    return settings
+
+
+def run_style_transfer(input_image, output_image, style_name, preview=False, tiled=False, output_format=None):
+    """Stylize ``input_image`` into ``output_image``.
+
+    Both may be paths or file objects, so uploads can be decoded straight
+    from their stream and results encoded straight into their destination
+    (pass ``output_format`` when writing to a file object).
+    """
+    # Fail fast on unknown styles before decoding the image
+    style_models.get(style_name)
 
     # Load and preprocess input image
-    image = Image.open(input_image_path).convert("RGB")
-    transform = transforms.Compose([
-        transforms.Resize(512),
-        transforms.ToTensor(),
-        transforms.Lambda(lambda x: x.mul(255))
-    ])
-    tensor = transform(image).unsqueeze(0)
+    short_side = None if tiled else (PREVIEW_SHORT_SIDE if preview else RESIZE_SHORT_SIDE)
+    with style_stage_seconds.timer(stage="decode"):
+        image = decode_image(input_image, short_side, max_pixels=TILED_MAX_PIXELS if tiled else None)
+        tensor = preprocess_image(image, short_side)
+    del image
 
     # Run inference
-    with torch.no_grad():
-        output = model(tensor).cpu()
+    with style_stage_seconds.timer(stage="tiled_inference" if tiled else "inference"):
+        if tiled:
+            # Full resolution, bounded memory
+            output = stylize_tiled(style_name, tensor)
+        else:
+            output = stylize(style_name, tensor)
+    del tensor
 
     # Postprocess & save output image
-    output = output.squeeze(0).clamp(0, 255).permute(1, 2, 0).byte().numpy()
-    output_image = Image.fromarray(output)
-    output_image.save(output_image_path)
+    with style_stage_seconds.timer(stage="encode"):
+        postprocess_tensor(output).save(output_image, format=output_format)
 
     return True
@@ -0,0 +1,60 @@
+# uploads.py
+#
+# Upload handling shared by every route: bodies over MAX_CONTENT_LENGTH are
+# refused from the Content-Length header before anything is read, and each
+# multipart file is streamed in chunks straight into a named temp file on
+# disk (werkzeug's default keeps small files in memory). Resolvers then work
+# from the file's path, so memory use doesn't grow with upload size.
+
+import os
+import tempfile
+
+from flask import Request, jsonify, request
+
+from app.pdf_extract import MAX_STREAM_PDF_SIZE
+
+# Largest request body accepted; defaults to the streaming PDF limit plus form overhead
+MAX_CONTENT_LENGTH = int(os.environ.get("MAX_UPLOAD_MB", MAX_STREAM_PDF_SIZE // (1024 * 1024) + 1)) * 1024 * 1024
+UPLOAD_TMP_DIR = os.environ.get("UPLOAD_TMP_DIR") or None  # None -> system temp dir
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Deleted when werkzeug closes the request's files at the end of the request
+        suffix = os.path.splitext(filename or "")[1][:16]
+        return tempfile.NamedTemporaryFile("wb+", dir=UPLOAD_TMP_DIR, prefix="upload-", suffix=suffix)
+
+
+def upload_path(file):
+    """Path of the temp file holding an upload, or None if it isn't on disk."""
+    stream = file.stream
+    name = getattr(stream, "name", None)
+    if not isinstance(name, str) or not os.path.isfile(name):
+        return None
+    stream.flush()
+    return name
+
+
+def keep_upload(file, dest):
+    """Give an upload a lasting name at ``dest`` (a hard link when possible, no copy)."""
+    path = upload_path(file)
+    if path is not None:
+        try:
+            os.link(path, dest)
+            return
+        except OSError:
+            pass  # e.g. another filesystem; fall back to a chunked copy
+    file.save(dest)
+
+
+def reject_oversized_body():
+    """before_request hook: refuse a too-large body before reading any of it."""
+    if request.content_length is not None and request.content_length > MAX_CONTENT_LENGTH:
+        limit = MAX_CONTENT_LENGTH // (1024 * 1024)
+        return jsonify({"success": False, "message": f"Request too large. Max {limit} MB allowed."}), 413
+
+
+def init_app(app):
+    app.request_class = UploadRequest
+    app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+    app.before_request(reject_oversized_body)
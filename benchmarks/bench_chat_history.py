@@ -0,0 +1,99 @@
+# bench_chat_history.py
+#
+# Seeds a SQLite database with millions of ChatHistory rows and times the
+# "last N turns" lookup and getChatHistory pages, with and without the
+# (user_id, id) index, for a light user and for the heaviest user.
+#
+#   python benchmarks/bench_chat_history.py --rows 3000000 --users 5000
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask
+
+from app.models import db
+from app.chat_history import history_page, recent_turns
+
+INDEX = "ix_chat_history_user_id_id"
+
+
+def seed(path, rows, users):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany(
+        "INSERT INTO user (id, username, password_hash) VALUES (?, ?, 'x')",
+        ((i, f"user{i}") for i in range(1, users + 1)),
+    )
+    # Skewed: user 1 owns ~10% of all rows, the rest are spread uniformly
+    rng = random.Random(0)
+    batch = []
+    for i in range(rows):
+        user_id = 1 if rng.random() < 0.1 else rng.randint(2, users)
+        batch.append((user_id, "user" if i % 2 == 0 else "assistant", f"message {i}"))
+        if len(batch) == 100_000:
+            conn.executemany("INSERT INTO chat_history (user_id, role, content) VALUES (?, ?, ?)", batch)
+            batch.clear()
+    if batch:
+        conn.executemany("INSERT INTO chat_history (user_id, role, content) VALUES (?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def timeit(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def report(label, repeat, users):
+    light = users // 2
+    print(f"[{label}]")
+    print(f"  recent_turns(light user)      {timeit(lambda: recent_turns(light), repeat):8.3f} ms")
+    print(f"  recent_turns(heavy user)      {timeit(lambda: recent_turns(1), repeat):8.3f} ms")
+    print(f"  history_page(heavy, first=50) {timeit(lambda: history_page(1, first=50), repeat):8.3f} ms")
+    cursor = history_page(1, first=50, after=None)[-1]["id"]
+    print(f"  history_page(heavy, after=..) "
+          f"{timeit(lambda: history_page(1, first=50, after=cursor), repeat):8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "bench_chat_history.db"))
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{args.db}"
+    db.init_app(app)
+
+    with app.app_context():
+        if not os.path.exists(args.db):
+            db.create_all()
+            print(f"Seeding {args.rows:,} rows into {args.db} ...")
+            seed(args.db, args.rows, args.users)
+
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {INDEX}")
+        report("without index", max(1, args.repeat // 10), args.users)
+
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql(f"CREATE INDEX {INDEX} ON chat_history (user_id, id)")
+        report("with (user_id, id) index", args.repeat, args.users)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# bench_inference_backends.py
+#
+# Times each TransformerNet inference backend and checks its output against
+# the eager float32 model for every style (max abs error and PSNR, 0-255).
+#
+#   python benchmarks/bench_inference_backends.py --runs 10 --size 512
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import torch
+
+from app.inference_backend import BACKENDS, configure_torch_threads
+from app.style_transfer import STYLE_MODELS, load_style_model
+
+
+def timed(model, tensor, runs):
+    with torch.no_grad():
+        model(tensor)  # warm-up
+        start = time.perf_counter()
+        for _ in range(runs):
+            out = model(tensor)
+    return out.clamp(0, 255), (time.perf_counter() - start) / runs
+
+
+def psnr(a, b):
+    mse = torch.mean((a - b) ** 2).item()
+    return float("inf") if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--styles", nargs="+", default=["mosaic", "candy", "udnie"])
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        configure_torch_threads(args.threads)
+    print(f"torch threads: {torch.get_num_threads()}")
+
+    torch.manual_seed(0)
+    tensor = torch.rand(1, 3, args.size, args.size * 4 // 3) * 255
+
+    for style in args.styles:
+        path = STYLE_MODELS.get(style)
+        if not path or not os.path.exists(path):
+            print(f"[{style}] skipped: model file not found")
+            continue
+
+        reference, eager_time = timed(load_style_model(path, "eager"), tensor, args.runs)
+        print(f"[{style}]")
+        for backend in args.backends:
+            try:
+                model = load_style_model(path, backend)
+            except Exception as e:
+                print(f"  {backend:>14}: unavailable ({e})")
+                continue
+            out, elapsed = timed(model, tensor, args.runs)
+            max_err = (out - reference).abs().max().item()
+            print(f"  {backend:>14}: {elapsed * 1000:7.1f} ms/img  "
+                  f"x{eager_time / elapsed:4.2f}  max|err| {max_err:6.2f}  "
+                  f"PSNR {psnr(out, reference):5.1f} dB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# bench_login_storm.py
+#
+# Measures chat latency on its own and then during a login storm, to check
+# that bcrypt work is capped below Waitress's thread count instead of
+# starving request threads. Requests go over HTTP to a real Waitress server
+# with a fixed number of threads, as in production. Ollama is replaced by a
+# fixed reply so only the server's own work is measured, and the login rate
+# limits are lifted so every storm attempt reaches bcrypt (the case the
+# hashing queue limit has to handle).
+#
+#   python benchmarks/bench_login_storm.py --threads 4 --storm-threads 64 --seconds 10
+#
+# Runs against a throwaway SQLite database (DATABASE_URL is set before import).
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+CHAT = 'mutation { chat(username: "%s", message: "hello") { reply } }'
+LOGIN = 'mutation { login(username: "%s", password: "%s") { success message } }'
+
+
+class FakeStream(list):
+    # Stands in for an Ollama token stream
+    def close(self):
+        pass
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+
+def post(conn, query):
+    conn.request("POST", "/graphql", body=json.dumps({"query": query}),
+                 headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    return json.loads(response.read())
+
+
+def chat_latencies(port, username, seconds):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        post(conn, CHAT % username)
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=4, help="Waitress threads (WAITRESS_THREADS)")
+    parser.add_argument("--storm-threads", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    # Read at import time: the hashing queue limit is derived from WAITRESS_THREADS
+    os.environ["WAITRESS_THREADS"] = str(args.threads)
+    os.environ.setdefault("LOGIN_USER_BURST", "1000000")
+    os.environ.setdefault("LOGIN_IP_BURST", "1000000")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_login.db")
+    from waitress import create_server
+
+    import app.chat_cache
+    import app.llm_client
+    from app.main import my_app
+    from app.models import db, User
+    from app.passwords import PASSWORD_QUEUE_LIMIT, password_hasher, password_rejections
+
+    app.chat_cache.open_chat_stream = lambda messages: FakeStream(["benchmark reply"])
+    app.llm_client.chat = lambda messages, **kwargs: "benchmark summary"
+
+    with my_app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(username="chatter", password_hash=password_hasher.hash("secret")))
+        db.session.add_all(User(username=f"victim{i}", password_hash=password_hasher.hash("secret"))
+                           for i in range(20))
+        db.session.commit()
+
+    # Queued requests are the point of the storm; don't log every one
+    logging.getLogger("waitress.queue").setLevel(logging.ERROR)
+    server = create_server(my_app, host="127.0.0.1", port=0, threads=args.threads)
+    port = server.effective_port
+    threading.Thread(target=server.run, daemon=True).start()
+
+    baseline = chat_latencies(port, "chatter", args.seconds)
+
+    stop = threading.Event()
+    outcomes = {"attempts": 0, "busy": 0}
+
+    def stormer(seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        while not stop.is_set():
+            query = LOGIN % (f"victim{rng.randrange(20)}", f"guess{rng.random()}")
+            result = post(conn, query)
+            outcomes["attempts"] += 1
+            if "busy" in (result.get("data", {}).get("login") or {}).get("message", ""):
+                outcomes["busy"] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=stormer, args=(i,), daemon=True) for i in range(args.storm_threads)]
+    for t in threads:
+        t.start()
+    during = chat_latencies(port, "chatter", args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print(f"waitress threads {args.threads}  password queue limit {PASSWORD_QUEUE_LIMIT}")
+    for label, values in (("baseline", baseline), ("during storm", during)):
+        print(f"chat {label:13s} {len(values):6d} req  p50 {statistics.median(values) * 1000:7.2f} ms  "
+              f"p95 {percentile(values, 0.95):7.2f} ms")
+    print(f"login attempts {outcomes['attempts']}  answered busy {outcomes['busy']}  "
+          f"hasher busy {password_rejections.value(op='verify')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# bench_pdf_extract.py
+#
+# Generates a text-heavy PDF (or uses one you pass in) and compares
+# single-threaded page extraction with the sharded process-pool engine.
+#
+#   python benchmarks/bench_pdf_extract.py --pages 300
+#   python benchmarks/bench_pdf_extract.py --pdf manual.pdf --workers 8
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import fitz  # PyMuPDF
+
+from app.pdf_extract import extract_pages
+
+LOREM = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua. ")
+
+
+def make_pdf(path, pages):
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        rect = fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36)
+        page.insert_textbox(rect, f"Page {n + 1}\n" + LOREM * 40, fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def timed(path, workers, threshold):
+    doc = fitz.open(path, filetype="pdf")
+    try:
+        start = time.perf_counter()
+        pages = extract_pages(doc, path, workers=workers, threshold=threshold)
+        return pages, time.perf_counter() - start
+    finally:
+        doc.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    path = args.pdf
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(), "bench.pdf")
+        make_pdf(path, args.pages)
+
+    # Warm up the pool so process start-up isn't counted
+    timed(path, args.workers, threshold=1)
+
+    sequential, seq_time = timed(path, 1, threshold=1)
+    parallel, par_time = timed(path, args.workers, threshold=1)
+    assert [p["page"] for p in parallel] == [p["page"] for p in sequential]
+    assert parallel == sequential
+
+    print(f"{len(sequential)} pages")
+    print(f"  sequential: {seq_time:6.2f}s  ({len(sequential) / seq_time:7.1f} pages/s)")
+    print(f"  {args.workers} workers: {par_time:6.2f}s  ({len(parallel) / par_time:7.1f} pages/s)  "
+          f"speedup x{seq_time / par_time:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# bench_style_batching.py
+#
+# Compares style-transfer throughput (images/sec) of the one-at-a-time path
+# against the micro-batching worker, with N client threads submitting at once.
+#
+#   python benchmarks/bench_style_batching.py --images 32 --clients 8
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import torch
+
+from app.style_transfer import STYLE_MODELS, style_models
+from app.style_batcher import StyleTransferBatcher
+from app.transformer_net import TransformerNet
+
+
+def make_style(style):
+    if style in STYLE_MODELS and os.path.exists(STYLE_MODELS[style]):
+        return style
+    # No trained weights around: random weights cost the same to run
+    path = os.path.join(tempfile.mkdtemp(), "bench.pth")
+    torch.save(TransformerNet().state_dict(), path)
+    STYLE_MODELS["bench"] = path
+    return "bench"
+
+
+def sequential(style, tensors, clients):
+    model = style_models.get(style)
+
+    def one(t):
+        with torch.no_grad():
+            return model(t.unsqueeze(0))
+
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(one, tensors))
+
+
+def batched(style, tensors, clients, batch_size, wait_ms):
+    batcher = StyleTransferBatcher(max_batch_size=batch_size, max_wait_ms=wait_ms)
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(lambda t: batcher.submit(style, t).result(), tensors))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--style", default="mosaic")
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--wait-ms", type=float, default=20)
+    parser.add_argument("--size", type=int, nargs=2, default=[512, 683])
+    args = parser.parse_args()
+
+    style = make_style(args.style)
+    h, w = args.size
+    # A few aspect ratios: only same-shape images share a batch
+    tensors = [torch.rand(3, h, w if i % 4 else h) * 255 for i in range(args.images)]
+
+    # Warm up model load and torch kernels
+    sequential(style, tensors[:2], 1)
+
+    for name, fn in (
+        ("one-at-a-time", lambda: sequential(style, tensors, args.clients)),
+        ("batched", lambda: batched(style, tensors, args.clients,
+                                    args.batch_size, args.wait_ms)),
+    ):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        print(f"{name:>14}: {args.images / elapsed:6.2f} images/sec ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# load_stream_chat.py
+#
+# Load test for /stream-chat: opens N concurrent SSE streams and reports
+# time-to-first-token and total stream time percentiles.
+#
+# 1. Start a fake Ollama that streams tokens slowly (no GPU needed):
+#      python benchmarks/load_stream_chat.py fake-ollama --port 11435
+# 2. Start the server against it, e.g. the ASGI mode:
+#      OLLAMA_HOST=http://127.0.0.1:11435 python run_asgi.py
+#    (or run_waitress.py to compare with the threaded server)
+# 3. Fire the streams (the user must already be registered):
+#      python benchmarks/load_stream_chat.py run --username loadtest --concurrency 300
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+
+def fake_ollama_app(tokens, token_delay):
+    from starlette.applications import Starlette
+    from starlette.responses import StreamingResponse
+    from starlette.routing import Route
+
+    async def chat(request):
+        body = await request.json()
+
+        async def generate():
+            for i in range(tokens):
+                await asyncio.sleep(token_delay)
+                yield json.dumps({
+                    "model": body.get("model"),
+                    "created_at": "2024-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": f"tok{i} "},
+                    "done": False,
+                }) + "\n"
+            yield json.dumps({
+                "model": body.get("model"),
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+            }) + "\n"
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    return Starlette(routes=[Route("/api/chat", chat, methods=["POST"])])
+
+
+async def one_stream(client, url, username, results):
+    start = time.perf_counter()
+    first = None
+    tokens = 0
+    try:
+        async with client.stream("POST", url, json={"username": username, "message": "hi"}) as resp:
+            async for line in resp.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                if line.startswith("data: Error") or line.startswith("data: Invalid"):
+                    raise RuntimeError(line)
+                if first is None:
+                    first = time.perf_counter() - start
+                tokens += 1
+        results.append((first, time.perf_counter() - start, tokens))
+    except Exception as e:
+        results.append(e)
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run_load(url, username, concurrency, timeout):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results = []
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one_stream(client, url, username, results) for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    ok = [r for r in results if not isinstance(r, Exception) and r[0] is not None]
+    errors = [r for r in results if isinstance(r, Exception)]
+    print(f"streams: {len(ok)} ok / {len(errors)} failed in {wall:.2f}s")
+    if errors:
+        print(f"first error: {errors[0]!r}")
+    if ok:
+        ttft = [r[0] for r in ok]
+        total = [r[1] for r in ok]
+        print(f"TTFT   p50 {pct(ttft, 0.5) * 1000:8.1f} ms  p95 {pct(ttft, 0.95) * 1000:8.1f} ms  "
+              f"p99 {pct(ttft, 0.99) * 1000:8.1f} ms  mean {statistics.mean(ttft) * 1000:8.1f} ms")
+        print(f"total  p50 {pct(total, 0.5):8.2f} s   p95 {pct(total, 0.95):8.2f} s")
+        print(f"tokens/sec (aggregate): {sum(r[2] for r in ok) / wall:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fake = sub.add_parser("fake-ollama")
+    fake.add_argument("--port", type=int, default=11435)
+    fake.add_argument("--tokens", type=int, default=50)
+    fake.add_argument("--token-delay", type=float, default=0.05)
+
+    run = sub.add_parser("run")
+    run.add_argument("--url", default="http://127.0.0.1:8001/stream-chat")
+    run.add_argument("--username", default="loadtest")
+    run.add_argument("--concurrency", type=int, default=200)
+    run.add_argument("--timeout", type=float, default=120)
+
+    args = parser.parse_args()
+    if args.command == "fake-ollama":
+        import uvicorn
+        uvicorn.run(fake_ollama_app(args.tokens, args.token_delay), host="127.0.0.1",
+                    port=args.port, log_level="warning", backlog=4096)
+    else:
+        asyncio.run(run_load(args.url, args.username, args.concurrency, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# profile_style_memory.py
+#
+# Compares peak memory of the old decode -> ToTensor -> Lambda(mul) -> clamp/
+# permute/byte -> PIL save pipeline with the streaming one in style_transfer.py.
+# Each pipeline runs in a fresh subprocess; peak RSS growth is reported along
+# with the number/size of CPU tensor allocations seen by the torch profiler.
+#
+#   python benchmarks/profile_style_memory.py path/to/photo.jpg
+#
+# The model is skipped by default (identity) so only the pipeline copies are
+# measured; pass --with-model STYLE to include a real forward pass.
+
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def legacy_pipeline(path, stylize):
+    from PIL import Image
+    from torchvision import transforms
+
+    image = Image.open(path).convert("RGB")
+    transform = transforms.Compose([
+        transforms.Resize(512),
+        transforms.ToTensor(),
+        transforms.Lambda(lambda x: x.mul(255)),
+    ])
+    tensor = transform(image).unsqueeze(0)
+    output = stylize(tensor.squeeze(0)).unsqueeze(0)
+    output = output.squeeze(0).clamp(0, 255).permute(1, 2, 0).byte().numpy()
+    Image.fromarray(output).save(io.BytesIO(), format="PNG")
+
+
+def streaming_pipeline(path, stylize):
+    from app.style_transfer import decode_image, preprocess_image, postprocess_tensor
+
+    with open(path, "rb") as stream:
+        image = decode_image(stream)
+        tensor = preprocess_image(image)
+    del image
+    output = stylize(tensor)
+    del tensor
+    postprocess_tensor(output).save(io.BytesIO(), format="PNG")
+
+
+def child(pipeline, path, style):
+    import torch
+    from torch.profiler import ProfilerActivity, profile
+
+    if style:
+        from app.style_transfer import style_models
+        model = style_models.get(style)
+
+        def stylize(t):
+            with torch.no_grad():
+                return model(t.unsqueeze(0)).squeeze(0)
+    else:
+        def stylize(t):
+            return t.clone()
+
+    run = legacy_pipeline if pipeline == "legacy" else streaming_pipeline
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        run(path, stylize)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    events = [e for e in prof.events() if e.cpu_memory_usage > 0]
+    print(json.dumps({
+        "peak_rss_growth_mb": (peak - baseline) / 1024,
+        "tensor_allocations": len(events),
+        "tensor_bytes_mb": sum(e.cpu_memory_usage for e in events) / (1024 * 1024),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("image")
+    parser.add_argument("--with-model", metavar="STYLE", default="")
+    parser.add_argument("--child", choices=["legacy", "streaming"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.image, args.with_model)
+        return
+
+    for pipeline in ("legacy", "streaming"):
+        out = subprocess.run(
+            [sys.executable, __file__, args.image, "--child", pipeline,
+             "--with-model", args.with_model],
+            check=True, capture_output=True, text=True,
+        ).stdout.strip().splitlines()[-1]
+        stats = json.loads(out)
+        print(f"{pipeline:>10}: peak RSS +{stats['peak_rss_growth_mb']:7.1f} MB  "
+              f"{stats['tensor_allocations']:4d} tensor allocs  "
+              f"{stats['tensor_bytes_mb']:7.1f} MB allocated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""add (user_id, id) index to chat_history
+
+Revision ID: 3f1c2a7d9b10
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7d9b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created with db.create_all() on a newer model already have it
+    op.create_index(
+        'ix_chat_history_user_id_id', 'chat_history', ['user_id', 'id'],
+        unique=False, if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index('ix_chat_history_user_id_id', table_name='chat_history', if_exists=True)
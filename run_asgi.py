@@ -0,0 +1,18 @@
+# run_asgi.py
+
+import sys
+import os
+
+# Ensure the project root is in the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+
+import uvicorn
+
+PORT = int(os.environ.get("PORT", 8001))
+
+print(f"🚀 Starting ASGI server (uvicorn) on http://0.0.0.0:{PORT} ...")
+
+if __name__ == "__main__":
+    # One process, one event loop: streams are coroutines, not threads
+    uvicorn.run("app.asgi:app", host="0.0.0.0", port=PORT, loop="asyncio",
+                timeout_keep_alive=30, backlog=2048)
@@ -1,4 +1,8 @@
 # run_waitress.py
+#
+# Style jobs and PDF shards run on "spawn" process pools, and every spawned
+# worker re-runs this file as __mp_main__. Only the path setup is at module
+# level so workers don't build the Flask app or load the style models.
 
 import sys
 import os
@@ -6,11 +10,19 @@ import os
 # Ensure the project root is in the path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
 
-from waitress import serve
-from app.main import my_app
+if __name__ == "__main__":
+    from waitress import serve
+    from app.main import my_app
+    from app.style_transfer import style_models
+    from app.inference_backend import WAITRESS_THREADS, configure_torch_threads
 
-print("🚀 Starting Waitress server on http://0.0.0.0:8000 ...")
+    # Split cores between Waitress threads before any inference runs
+    configure_torch_threads()
 
-if __name__ == "__main__":
-    serve(my_app, host="0.0.0.0", port=8001)
-    print("✅ Server started successfully!")
\ No newline at end of file
+    # Load style models before the first request instead of on first use
+    if os.environ.get("WARM_STYLE_MODELS", "1") == "1":
+        style_models.warm()
+
+    print("🚀 Starting Waitress server on http://0.0.0.0:8000 ...")
+    serve(my_app, host="0.0.0.0", port=8001, threads=WAITRESS_THREADS)
+    print("✅ Server started successfully!")
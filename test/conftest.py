@@ -0,0 +1,16 @@
+import pytest
+from flask import Flask
+
+from app.models import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Bare Flask app on a throwaway SQLite file (shared across threads)."""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+from app.auth import TokenAuth, TokenRevocationList, bearer_token
+
+
+def test_token_round_trips_user_id():
+    auth = TokenAuth(secret_key="test")
+
+    assert auth.user_id(auth.issue(42)) == 42
+
+
+def test_tampered_or_foreign_tokens_are_rejected():
+    auth = TokenAuth(secret_key="test")
+    token = auth.issue(42)
+
+    assert auth.user_id(token[:-2] + "xx") is None
+    assert TokenAuth(secret_key="other").user_id(token) is None
+    assert auth.user_id(None) is None
+
+
+def test_revoked_token_stops_working():
+    auth = TokenAuth(secret_key="test")
+    token, other = auth.issue(42), auth.issue(42)
+
+    assert auth.revoke(token)
+
+    assert auth.user_id(token) is None
+    # Other sessions of the same user are unaffected
+    assert auth.user_id(other) == 42
+    assert not auth.revoke("garbage")
+
+
+def test_revocation_list_forgets_expired_entries():
+    now = [100.0]
+    revoked = TokenRevocationList(clock=lambda: now[0])
+    revoked.revoke("a", expires_at=150)
+
+    now[0] = 200
+    revoked.revoke("b", expires_at=300)
+
+    assert not revoked.is_revoked("a")
+    assert revoked.is_revoked("b")
+
+
+def test_bearer_token_from_header():
+    request = SimpleNamespace(headers={"Authorization": "Bearer abc.def"})
+
+    assert bearer_token(request) == "abc.def"
+    assert bearer_token(SimpleNamespace(headers={"Authorization": "Basic xyz"})) is None
+    assert bearer_token(SimpleNamespace(headers={})) is None
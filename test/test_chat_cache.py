@@ -0,0 +1,124 @@
+import asyncio
+import threading
+
+from app.chat_cache import ChatResponseCache, cache_key
+
+
+class FakeStream:
+    def __init__(self, tokens, gate=None):
+        self.tokens = tokens
+        self.gate = gate
+        self.closed = False
+
+    def __iter__(self):
+        for token in self.tokens:
+            if self.gate:
+                self.gate.wait()
+            yield token
+
+    def close(self):
+        self.closed = True
+
+
+MESSAGES = [
+    {"role": "system", "content": "You are Tintu 🧸, a helpful bot."},
+    {"role": "user", "content": "Hi there!"},
+]
+
+
+def test_cache_key_normalizes_whitespace_and_role_case():
+    other = [
+        {"role": "System", "content": "You are  Tintu 🧸, a helpful bot. "},
+        {"role": "user", "content": "Hi\nthere!"},
+    ]
+    assert cache_key(MESSAGES, "my-chat", {}) == cache_key(other, "my-chat", {})
+    assert cache_key(MESSAGES, "my-chat", {}) != cache_key(MESSAGES, "other", {})
+
+
+def test_repeat_request_is_served_from_cache():
+    calls = []
+
+    def open_stream(messages, model, options):
+        calls.append(messages)
+        return FakeStream(["Hello", " you"])
+
+    cache = ChatResponseCache(open_stream, ttl=60)
+    assert "".join(cache.open(MESSAGES, "my-chat")) == "Hello you"
+    assert "".join(cache.open(MESSAGES, "my-chat")) == "Hello you"
+    assert len(calls) == 1
+
+
+def test_concurrent_identical_requests_share_one_generation():
+    gate = threading.Event()
+    calls = []
+
+    def open_stream(messages, model, options):
+        calls.append(messages)
+        return FakeStream(["a", "b", "c"], gate)
+
+    cache = ChatResponseCache(open_stream, ttl=60)
+    first = cache.open(MESSAGES, "my-chat")
+    second = cache.open(MESSAGES, "my-chat")
+
+    results = []
+    threads = [threading.Thread(target=lambda s=s: results.append("".join(s))) for s in (first, second)]
+    for t in threads:
+        t.start()
+    gate.set()
+    for t in threads:
+        t.join(timeout=5)
+
+    assert results == ["abc", "abc"]
+    assert len(calls) == 1
+
+
+def test_failed_generation_is_not_cached():
+    calls = []
+
+    class Boom(FakeStream):
+        def __iter__(self):
+            yield "partial"
+            raise RuntimeError("ollama went away")
+
+    def open_stream(messages, model, options):
+        calls.append(messages)
+        return Boom([])
+
+    cache = ChatResponseCache(open_stream, ttl=60)
+    for _ in range(2):
+        try:
+            list(cache.open(MESSAGES, "my-chat"))
+        except RuntimeError:
+            pass
+    assert len(calls) == 2
+
+
+def test_async_and_sync_requests_share_one_generation():
+    gate = threading.Event()
+    calls = []
+
+    def open_stream(messages, model, options):
+        calls.append(messages)
+        return FakeStream(["a", "b", "c"], gate)
+
+    cache = ChatResponseCache(open_stream, ttl=60)
+    sync_results = []
+    sync_reader = threading.Thread(target=lambda: sync_results.append("".join(cache.open(MESSAGES, "my-chat"))))
+    sync_reader.start()
+
+    async def read():
+        return "".join([token async for token in cache.aopen(MESSAGES, "my-chat")])
+
+    async def main():
+        readers = [asyncio.create_task(read()) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        gate.set()
+        return await asyncio.gather(*readers)
+
+    assert asyncio.run(main()) == ["abc", "abc", "abc"]
+    sync_reader.join(timeout=5)
+    assert sync_results == ["abc"]
+    assert len(calls) == 1
+    # Finished replies are served to async callers from the cache too
+    assert asyncio.run(read()) == "abc"
+    assert len(calls) == 1
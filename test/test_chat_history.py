@@ -0,0 +1,189 @@
+import threading
+import time
+
+from app import chat_history
+from app.chat_history import ChatHistoryWriter, ConversationCache, record_turn, recent_turns
+from app.models import db, ChatHistory, User
+
+
+def make_user(name="alice"):
+    user = User(username=name, password_hash="x")
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def make_writer(app, monkeypatch, **kwargs):
+    # Long interval: the tests flush by hand instead of racing the background thread
+    writer = ChatHistoryWriter(flush_size=1000, flush_interval=60, **kwargs)
+    writer.init_app(app)
+    monkeypatch.setattr(chat_history, "chat_writer", writer)
+    return writer
+
+
+def turns(*contents):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": c} for i, c in enumerate(contents)]
+
+
+def test_queued_turns_are_readable_before_and_after_the_flush(app, monkeypatch):
+    writer = make_writer(app, monkeypatch)
+    user_id = make_user()
+
+    writer.enqueue(user_id, turns("q1", "a1"))
+    assert [t["content"] for t in recent_turns(user_id, limit=10)] == ["q1", "a1"]
+
+    assert writer.flush() == 2
+    assert [t["content"] for t in recent_turns(user_id, limit=10)] == ["q1", "a1"]
+    assert db.session.query(ChatHistory).count() == 2
+    writer.drain()
+
+
+def test_read_during_a_flush_does_not_duplicate_turns(app, monkeypatch):
+    writer = make_writer(app, monkeypatch)
+    user_id = make_user()
+    writer.enqueue(user_id, turns("q1", "a1"))
+    results = []
+
+    def read():
+        with app.app_context():
+            results.append([t["content"] for t in recent_turns(user_id, limit=10)])
+            db.session.remove()
+
+    class ReadAfterCommit:
+        # Runs right after the batch is committed, before it leaves the queue
+        def inc(self, amount=1, **labels):
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join(timeout=0.3)
+
+    monkeypatch.setattr(chat_history, "chat_rows_written", ReadAfterCommit())
+    writer.flush()
+    for _ in range(50):
+        if results:
+            break
+        time.sleep(0.05)
+
+    assert results == [["q1", "a1"]]
+    writer.drain()
+
+
+def test_concurrent_reads_see_each_turn_once(app, monkeypatch):
+    writer = make_writer(app, monkeypatch)
+    user_id = make_user()
+    stop = threading.Event()
+    bad = []
+
+    def read():
+        with app.app_context():
+            while not stop.is_set():
+                contents = [t["content"] for t in recent_turns(user_id, limit=200)]
+                if len(contents) != len(set(contents)) or contents != sorted(contents, key=lambda c: int(c[1:])):
+                    bad.append(contents)
+                db.session.remove()
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    for i in range(0, 60, 2):
+        writer.enqueue(user_id, turns(f"t{i}", f"t{i + 1}"))
+        if i % 6 == 0:
+            writer.flush()
+    writer.flush()
+    stop.set()
+    for reader in readers:
+        reader.join()
+
+    assert bad == []
+    assert len(recent_turns(user_id, limit=200)) == 60
+    writer.drain()
+
+
+def test_failing_batch_is_dropped_after_max_retries(app, monkeypatch):
+    writer = make_writer(app, monkeypatch, max_retries=3)
+    writer.flush_interval = 0.01  # let the background thread retry quickly
+    user_id = make_user()
+    ChatHistory.__table__.drop(db.engine)
+    dropped = chat_history.chat_rows_dropped.value()
+
+    writer.enqueue(user_id, turns("q1", "a1"))
+
+    # Given up on: waiters are released instead of stalling on the batch forever
+    assert writer.wait_flushed(user_id, timeout=5)
+    assert writer.pending_for(user_id)[1] == []
+    assert chat_history.chat_rows_dropped.value() == dropped + 2
+    writer.drain()
+
+
+def contents(turns):
+    return [t["content"] for t in turns]
+
+
+def test_recorded_turn_reaches_the_cached_conversation(app, monkeypatch):
+    cache = ConversationCache(max_turns=4)
+    monkeypatch.setattr(chat_history, "conversation_cache", cache)
+    user_id = make_user()
+    record_turn(user_id, "q1", "a1")
+    assert contents(cache.recent(user_id, limit=4)) == ["q1", "a1"]
+
+    record_turn(user_id, "q2", "a2")
+    # Served from the buffer: the database copy is gone, the cache still has the new turn
+    db.session.query(ChatHistory).delete()
+    db.session.commit()
+    assert contents(cache.recent(user_id, limit=4)) == ["q1", "a1", "q2", "a2"]
+
+
+def test_turn_recorded_while_loading_forces_a_reload(app, monkeypatch):
+    cache = ConversationCache(max_turns=4)
+    monkeypatch.setattr(chat_history, "conversation_cache", cache)
+    user_id = make_user()
+    record_turn(user_id, "q1", "a1")
+    load = chat_history.recent_turns
+
+    def load_racing_a_write(uid, limit):
+        turns = load(uid, limit)
+        # Another request records a turn after the load read the database
+        record_turn(uid, "q2", "a2")
+        return turns
+
+    monkeypatch.setattr(chat_history, "recent_turns", load_racing_a_write)
+    assert contents(cache.recent(user_id, limit=4)) == ["q1", "a1"]
+    monkeypatch.setattr(chat_history, "recent_turns", load)
+
+    # The stale load was not kept, so the next read sees the racing turn
+    assert contents(cache.recent(user_id, limit=4)) == ["q1", "a1", "q2", "a2"]
+
+
+def test_user_changes_are_not_hidden_by_the_id_cache(app):
+    cache = ConversationCache()
+
+    # Unknown names are not cached, so a later registration is found
+    assert cache.user_id("bob") is None
+    bob = make_user("bob")
+    assert cache.user_id("bob") == bob
+
+    # A removed user's name and turns are dropped; a new account gets its own id
+    make_user("carol")
+    cache.recent(bob)
+    db.session.delete(db.session.get(User, bob))
+    db.session.commit()
+    cache.forget(bob)
+    new_bob = make_user("bob")
+    assert new_bob != bob
+    assert cache.user_id("bob") == new_bob
+
+
+def test_drain_writes_rows_without_notifying_listeners(app, monkeypatch):
+    writer = make_writer(app, monkeypatch)
+    user_id = make_user()
+    notified = []
+    monkeypatch.setattr(chat_history, "turn_listeners", [notified.append])
+
+    writer.enqueue(user_id, turns("q1", "a1"))
+    writer.flush()
+    assert notified == [user_id]
+
+    # At exit the summarizer's executor is already shut down; don't schedule on it
+    writer.enqueue(user_id, turns("q2", "a2"))
+    writer.drain()
+    assert notified == [user_id]
+    assert db.session.query(ChatHistory).count() == 4
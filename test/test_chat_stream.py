@@ -0,0 +1,35 @@
+import asyncio
+from types import SimpleNamespace
+
+from app import schema
+
+
+class FailingStream:
+    # One token, then Ollama goes away
+    def __iter__(self):
+        yield "Hel"
+        raise ConnectionError("ollama died")
+
+    def close(self):
+        pass
+
+
+class FakeChatService:
+    def user_id(self, username=None, token=None):
+        return 1
+
+    def start(self, user_id, message, document_id=None):
+        return SimpleNamespace(stream=FailingStream)
+
+
+def test_chat_stream_ends_with_the_error_when_generation_fails(monkeypatch):
+    monkeypatch.setattr(schema, "chat_service", FakeChatService())
+    info = SimpleNamespace(context={"blocking": True})
+
+    async def events():
+        return [event async for event in schema.chat_stream_source(None, info, "hi", username="alice")]
+
+    assert asyncio.run(events()) == [
+        {"token": "Hel", "done": False},
+        {"token": None, "done": True, "error": "ollama died"},
+    ]
@@ -0,0 +1,67 @@
+from app.context_builder import estimate_tokens, select_turns
+
+
+def turn(role, words):
+    return {"role": role, "content": " ".join(["word"] * words)}
+
+
+def test_select_turns_keeps_newest_turns_in_order():
+    turns = [turn("user", 10), turn("assistant", 10), turn("user", 10), turn("assistant", 10)]
+    per_turn = estimate_tokens(turns[0]["content"])
+
+    selected = select_turns(turns, budget=per_turn * 2)
+
+    assert selected == turns[-2:]
+
+
+def test_select_turns_stops_at_first_turn_that_does_not_fit():
+    turns = [turn("user", 5), turn("assistant", 500), turn("user", 5)]
+
+    selected = select_turns(turns, budget=estimate_tokens(turns[0]["content"]) * 3)
+
+    # The huge middle turn ends the window; older turns aren't skipped past it
+    assert selected == turns[-1:]
+
+
+def test_select_turns_with_no_budget_is_empty():
+    assert select_turns([turn("user", 3)], budget=0) == []
+
+
+def test_every_turn_is_in_the_window_or_the_summary(app, monkeypatch):
+    from app import context_builder, llm_client
+    from app.chat_history import ConversationCache
+    from app.context_builder import RollingSummarizer, build_messages
+    from app.models import db, ChatHistory, User
+
+    summarized = []
+
+    def fake_chat(messages, options=None):
+        # The transcript is the new messages; remember which ones were folded in
+        summarized.extend(line.split(": ", 1)[1] for line in messages[-1]["content"].split("\n")
+                          if line.startswith(("user: ", "assistant: ")))
+        return "summary"
+
+    monkeypatch.setattr(llm_client, "chat", fake_chat)
+    monkeypatch.setattr(context_builder, "summarizer", RollingSummarizer())
+    monkeypatch.setattr(context_builder, "conversation_cache", ConversationCache())
+
+    user = User(username="alice", password_hash="x")
+    db.session.add(user)
+    db.session.commit()
+    # Short questions and ~200-token replies: far fewer than CONTEXT_MAX_TURNS fit
+    contents = []
+    for i in range(30):
+        contents += [f"question {i}", f"answer {i} " + "word " * 160]
+    db.session.add_all(ChatHistory(user_id=user.id, role="user" if i % 2 == 0 else "assistant", content=c)
+                       for i, c in enumerate(contents))
+    db.session.commit()
+
+    while context_builder.summarizer.update(user.id):
+        pass
+
+    messages = build_messages(user.id, "a new question " + "word " * 200)
+    sent = [m["content"] for m in messages[2:-1]]
+    assert messages[1]["content"].endswith("summary")
+    assert 0 < len(sent) < 20
+    # The window and the summary together cover the whole conversation
+    assert set(summarized) | set(sent) == set(contents)
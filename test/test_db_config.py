@@ -0,0 +1,18 @@
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from app.db_config import db_query_seconds
+
+
+def test_failed_statements_leave_no_timer_state_on_the_connection():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        info = repr(conn.info)
+        for _ in range(3):
+            with pytest.raises(exc.OperationalError):
+                conn.execute(text("SELECT * FROM missing_table"))
+        conn.execute(text("SELECT 1"))
+
+        assert repr(conn.info) == info
+    assert any(line.startswith('db_query_seconds_count{statement="SELECT"}') for line in db_query_seconds.render())
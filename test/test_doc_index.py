@@ -0,0 +1,37 @@
+from app.doc_index import DocumentStore, chunk_pages
+
+DOC_ID = "ab" * 32
+VOCAB = ["cats", "dogs", "taxes"]
+
+
+def fake_embed(texts):
+    # One dimension per vocabulary word: cosine similarity becomes word overlap
+    return [[text.count(word) for word in VOCAB] for text in texts]
+
+
+def page(number, content):
+    return {"page": number, "content": content, "preview": content[:100]}
+
+
+def test_chunk_pages_overlaps_within_a_page():
+    chunks = chunk_pages([page(1, "abcdefghij"), page(2, "xyz")], chunk_chars=4, overlap=1)
+
+    assert [c["text"] for c in chunks] == ["abcd", "defg", "ghij", "xyz"]
+    assert [c["page"] for c in chunks] == [1, 1, 1, 2]
+
+
+def test_search_returns_most_similar_chunks_first(tmp_path):
+    store = DocumentStore(directory=str(tmp_path), embed_fn=fake_embed)
+    store.index(DOC_ID, [page(1, "cats cats"), page(2, "dogs"), page(3, "taxes taxes")])
+
+    results = store.search(DOC_ID, "how are taxes filed", k=2)
+
+    assert results[0]["page"] == 3
+    assert len(results) == 2
+
+
+def test_search_unknown_document_is_empty(tmp_path):
+    store = DocumentStore(directory=str(tmp_path), embed_fn=fake_embed)
+
+    assert store.search(DOC_ID, "cats") == []
+    assert store.search("../../etc/passwd", "cats") == []
@@ -0,0 +1,44 @@
+from graphql import build_schema, parse, validate
+
+from app.graphql_exec import DocumentCache, _persisted_query, depth_limit_rule, query_hash
+
+SCHEMA = build_schema("""
+    type Node { child: Node name: String }
+    type Query { root: Node }
+""")
+
+
+def depth_errors(query, max_depth):
+    return validate(SCHEMA, parse(query), [depth_limit_rule(max_depth)])
+
+
+def test_depth_limit_counts_nested_fields_and_fragments():
+    query = "{ root { child { ...F } } } fragment F on Node { child { name } }"
+
+    assert depth_errors(query, 4) == []
+    errors = depth_errors(query, 3)
+    assert len(errors) == 1
+    assert "depth 4" in errors[0].message
+
+
+def test_document_cache_reuses_parsed_documents():
+    cache = DocumentCache(max_size=1)
+    first = cache.get("{ root { name } }")
+
+    assert cache.get("{ root { name } }") is first
+    assert cache.query_for(query_hash("{ root { name } }")) == "{ root { name } }"
+
+    cache.get("{ root { child { name } } }")
+    # Evicted by the newer document
+    assert cache.query_for(query_hash("{ root { name } }")) is None
+
+
+def test_persisted_query_hash_must_match_text():
+    query = "{ root { name } }"
+    good = {"query": query, "extensions": {"persistedQuery": {"version": 1, "sha256Hash": query_hash(query)}}}
+    bad = {"query": query, "extensions": {"persistedQuery": {"version": 1, "sha256Hash": "0" * 64}}}
+    unknown = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "1" * 64}}}
+
+    assert _persisted_query(good) == (query, None)
+    assert _persisted_query(bad)[1]["errors"][0]["message"] == "provided sha does not match query"
+    assert _persisted_query(unknown)[1]["errors"][0]["extensions"]["code"] == "PERSISTED_QUERY_NOT_FOUND"
@@ -0,0 +1,32 @@
+from app.metrics import Counter, Histogram
+
+
+def test_histogram_timer_observes_the_block():
+    histogram = Histogram("test_timer_seconds", "test", ["stage"], buckets=(1, 10))
+
+    with histogram.timer(stage="fast"):
+        pass
+
+    lines = histogram.render()
+    assert 'test_timer_seconds_bucket{stage="fast",le="1"} 1' in lines
+    assert 'test_timer_seconds_count{stage="fast"} 1' in lines
+
+
+def test_histogram_timer_observes_even_when_the_block_raises():
+    histogram = Histogram("test_timer_error_seconds", "test")
+
+    try:
+        with histogram.timer():
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert "test_timer_error_seconds_count 1" in histogram.render()
+
+
+def test_counter_labels_are_escaped():
+    counter = Counter("test_escaped_total", "test", ["operation"])
+
+    counter.inc(operation='query "x"')
+
+    assert 'test_escaped_total{operation="query \\"x\\""} 1' in counter.render()
@@ -0,0 +1,30 @@
+import time
+
+from flask import Flask, Response
+
+from app import observability
+
+
+def test_streamed_response_is_timed_until_the_last_chunk():
+    app = Flask(__name__)
+    observability.init_app(app)
+
+    @app.route("/slow-stream")
+    def slow_stream():
+        def generate():
+            for _ in range(3):
+                time.sleep(0.1)
+                yield "data: x\n\n"
+        return Response(generate(), mimetype="text/event-stream")
+
+    with app.test_client() as client:
+        resp = client.get("/slow-stream")
+        assert resp.get_data() == b"data: x\n\n" * 3
+        resp.close()
+
+    lines = observability.http_request_seconds.render()
+    series = '{method="GET",route="/slow-stream",status="200"}'
+    assert f"http_request_duration_seconds_count{series} 1" in lines
+    total = next(float(line.split()[-1]) for line in lines
+                 if line.startswith(f"http_request_duration_seconds_sum{series}"))
+    assert total >= 0.3
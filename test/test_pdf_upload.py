@@ -0,0 +1,35 @@
+import io
+
+from flask import Flask
+
+from app import uploads
+from app.pdf_extract import MAX_STREAM_PDF_SIZE
+from app.pdf_upload import pdf_bp
+
+
+class TrackedBody(io.BytesIO):
+    read_any = False
+
+    def read(self, *args):
+        self.read_any = True
+        return super().read(*args)
+
+    readline = read
+
+
+def test_oversized_stream_pdf_is_refused_before_the_body_is_parsed():
+    app = Flask(__name__)
+    uploads.init_app(app)
+    app.register_blueprint(pdf_bp)
+    body = TrackedBody(b"--x\r\n")
+    # Over the route's limit but under MAX_CONTENT_LENGTH, so only the route can refuse it
+    size = MAX_STREAM_PDF_SIZE + 512 * 1024
+
+    resp = app.test_client().post(
+        "/upload-pdf/stream",
+        content_type="multipart/form-data; boundary=x",
+        environ_overrides={"wsgi.input": body, "CONTENT_LENGTH": str(size)},
+    )
+
+    assert resp.status_code == 413
+    assert not body.read_any
@@ -0,0 +1,48 @@
+from app.rate_limit import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_refused():
+    limiter = RateLimiter("test", burst=3, per_seconds=60, clock=FakeClock())
+
+    assert [limiter.allow("alice") for _ in range(4)] == [True, True, True, False]
+    # Other keys have their own bucket
+    assert limiter.allow("bob")
+
+
+def test_tokens_refill_over_time():
+    clock = FakeClock()
+    limiter = RateLimiter("test", burst=2, per_seconds=60, clock=clock)
+    limiter.allow("alice")
+    limiter.allow("alice")
+    assert not limiter.allow("alice")
+
+    clock.now += 30  # one token's worth
+    assert limiter.allow("alice")
+    assert not limiter.allow("alice")
+
+
+def test_reset_restores_full_burst():
+    limiter = RateLimiter("test", burst=1, clock=FakeClock())
+    limiter.allow("alice")
+
+    limiter.reset("alice")
+
+    assert limiter.allow("alice")
+
+
+def test_least_recently_used_keys_are_dropped():
+    limiter = RateLimiter("test", burst=1, max_keys=2, clock=FakeClock())
+    for key in ("a", "b", "c"):
+        limiter.allow(key)
+
+    # "a" was evicted, so it starts again with a full bucket
+    assert limiter.allow("a")
+    assert not limiter.allow("c")
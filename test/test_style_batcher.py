@@ -0,0 +1,25 @@
+import torch
+
+from app.style_batcher import StyleTransferBatcher
+from app.style_transfer import STYLE_MODELS, style_models
+from app.transformer_net import TransformerNet
+
+
+def test_batched_output_matches_one_at_a_time(tmp_path, monkeypatch):
+    torch.manual_seed(0)
+    path = str(tmp_path / "random.pth")
+    torch.save(TransformerNet().state_dict(), path)
+    monkeypatch.setitem(STYLE_MODELS, "random", path)
+    model = style_models.get("random")
+
+    # Two share a shape (one batch), one differs slightly (its own batch)
+    tensors = [torch.rand(3, 64, 96) * 255, torch.rand(3, 64, 96) * 255, torch.rand(3, 64, 100) * 255]
+    batcher = StyleTransferBatcher(max_batch_size=8, max_wait_ms=200)
+    futures = [batcher.submit("random", t) for t in tensors]
+
+    for tensor, future in zip(tensors, futures):
+        with torch.no_grad():
+            expected = model(tensor.unsqueeze(0)).squeeze(0)
+        out = future.result(timeout=60)
+        assert out.shape == tensor.shape
+        assert torch.allclose(out, expected, atol=1e-2)
@@ -0,0 +1,51 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from app import style_transfer
+from app.result_cache import result_key
+from app.style_transfer import StyleModelRegistry, decode_image, transfer_settings
+
+
+def png(width, height):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buf, format="PNG")
+    buf.seek(0)
+    return buf
+
+
+def test_decode_image_refuses_images_over_max_pixels():
+    with pytest.raises(ValueError, match="40x30"):
+        decode_image(png(40, 30), short_side=None, max_pixels=1000)
+
+
+def test_decode_image_keeps_full_size_within_max_pixels():
+    image = decode_image(png(40, 25), short_side=None, max_pixels=1000)
+
+    assert image.size == (40, 25)
+    assert image.mode == "RGB"
+
+
+def test_result_key_changes_with_the_model_file_and_backend(tmp_path, monkeypatch):
+    model_path = tmp_path / "mosaic.pth"
+    model_path.write_bytes(b"old weights")
+    monkeypatch.setattr(style_transfer, "style_models", StyleModelRegistry({"mosaic": str(model_path)}))
+    monkeypatch.setattr(style_transfer, "INFERENCE_BACKEND", "eager")
+    image = png(40, 30).getvalue()
+
+    def key():
+        return result_key(image, "mosaic", transfer_settings("mosaic"))
+
+    first = key()
+    assert key() == first
+
+    # Replaced weights: the registry reloads them, so the cached result is stale
+    model_path.write_bytes(b"new weights!")
+    os.utime(model_path, ns=(1, 1))
+    reloaded = key()
+    assert reloaded != first
+
+    monkeypatch.setattr(style_transfer, "INFERENCE_BACKEND", "int8")
+    assert key() != reloaded
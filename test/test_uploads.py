@@ -0,0 +1,41 @@
+import io
+import os
+
+from flask import Flask, jsonify, request
+
+from app import uploads
+
+
+def make_app():
+    app = Flask(__name__)
+    uploads.init_app(app)
+
+    @app.route("/upload", methods=["POST"])
+    def upload():
+        file = request.files["file"]
+        path = uploads.upload_path(file)
+        with open(path, "rb") as f:
+            return jsonify({"path": path, "content": f.read().decode()})
+
+    return app
+
+
+def test_small_uploads_are_spooled_to_a_named_file():
+    client = make_app().test_client()
+
+    resp = client.post("/upload", data={"file": (io.BytesIO(b"hello"), "a.pdf")})
+
+    body = resp.get_json()
+    assert body["content"] == "hello"
+    assert body["path"].endswith(".pdf")
+    # Removed together with the request
+    assert not os.path.exists(body["path"])
+
+
+def test_oversized_body_is_refused_from_content_length():
+    client = make_app().test_client()
+
+    resp = client.post("/upload", data=b"x",
+                       environ_overrides={"CONTENT_LENGTH": str(uploads.MAX_CONTENT_LENGTH + 1)})
+
+    assert resp.status_code == 413
@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+import time
+
+import fitz
+
+from app import pdf_extract
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_modules(*imports):
+    for name in imports:
+        __import__(name)
+    return sorted(name for name in sys.modules if name.split(".")[0] in ("app", "flask", "waitress", "torch"))
+
+
+def test_run_waitress_does_nothing_when_replayed_in_a_worker():
+    # What a spawned worker does with the parent's main script
+    script = ("import runpy, sys; runpy.run_path(sys.argv[1], run_name='__mp_main__'); "
+              "print(sorted(m for m in sys.modules if m.split('.')[0] in ('app', 'flask', 'waitress')))")
+    out = subprocess.run([sys.executable, "-c", script, os.path.join(ROOT, "run_waitress.py")],
+                         capture_output=True, text=True, check=True, cwd=ROOT).stdout
+
+    assert out.strip() == "[]"
+
+
+def test_style_job_workers_only_import_style_transfer():
+    from app.style_jobs import StyleJobManager
+
+    jobs = StyleJobManager(max_workers=1)
+    try:
+        modules = jobs._pool().submit(loaded_modules).result(timeout=120)
+    finally:
+        jobs.shutdown()
+
+    assert "app.style_transfer" in modules
+    assert "app.main" not in modules
+    assert "flask" not in modules
+
+
+def test_pdf_shard_workers_do_not_load_the_app_or_torch(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    doc = fitz.open()
+    for i in range(4):
+        doc.new_page().insert_text((72, 72), f"page {i + 1}")
+    doc.save(path)
+
+    try:
+        with fitz.open(path) as doc:
+            pages = pdf_extract.extract_pages(doc, path, workers=2, threshold=1)
+        modules = pdf_extract._get_pool().submit(loaded_modules, "app.pdf_extract").result(timeout=120)
+    finally:
+        pdf_extract._get_pool().shutdown()
+        pdf_extract._pool = None
+
+    assert [p["content"] for p in pages] == ["page 1", "page 2", "page 3", "page 4"]
+    assert not {"app.main", "flask", "torch"} & set(modules)
+
+
+def test_style_job_is_queued_until_a_worker_picks_it_up(tmp_path):
+    from app.style_jobs import StyleJobManager
+
+    jobs = StyleJobManager(max_workers=1)
+    try:
+        # Keep the only worker busy; the job still moves into the pool's call queue
+        busy = jobs._pool().submit(time.sleep, 3)
+        job_id = jobs.submit(str(tmp_path / "in.png"), str(tmp_path / "out.png"), "", "no-such-style")
+        time.sleep(0.5)
+        assert jobs.status(job_id)["status"] == "queued"
+
+        busy.result(timeout=120)
+        deadline = time.monotonic() + 30
+        while jobs.status(job_id)["status"] != "failed" and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert jobs.status(job_id)["status"] == "failed"
+        assert "no-such-style" in jobs.status(job_id)["message"]
+    finally:
+        jobs.shutdown()